@@ -1,12 +1,27 @@
+import time
+import uuid
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-from openai import OpenAI
-import numpy as np
-import io
-from docx import Document
-from docx.shared import Inches
-import tempfile
+from rating_engine import rate_rows, DEFAULT_CONCURRENCY, DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE, FALLBACK_RATING
+from llm_cache import LLMCache, DEFAULT_CACHE_PATH
+from excel_ingest import content_hash, read_survey_workbook
+from chart_render import render_chart_async, get_chart_png, render_seconds
+from jobs import JobManager, DEFAULT_JOB_WORKERS, DONE
+from tracing import Trace, DEFAULT_TRACE_LOG
+from openai_client import make_client, MAX_CONNECTIONS, SUMMARY_MAX_RETRIES
+from scoring import ScoreTable, cached_ratings
+from api_scheduler import ApiScheduler, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE, DEFAULT_MAX_IN_FLIGHT
+from report_core import (
+    TEMPLATE_PATH,
+    normalize_ratings,
+    changed_rows,
+    summary_inputs_key,
+    create_spider_chart,
+    comparison_spider_chart,
+    stream_executive_summary,
+    SUMMARY_TOKEN_BUDGET,
+    build_reports,
+)
 
 # Set page title
 st.set_page_config(page_title="Excel Data Processor", layout="wide")
@@ -31,194 +46,218 @@ if 'edits_confirmed' not in st.session_state:
     st.session_state.edits_confirmed = False
 if 'executive_summary' not in st.session_state:
     st.session_state.executive_summary = ""
+if 'rating_job_id' not in st.session_state:
+    st.session_state.rating_job_id = None
+if 'summary_job_id' not in st.session_state:
+    st.session_state.summary_job_id = None
+if 'rated_df' not in st.session_state:
+    st.session_state.rated_df = None
+if 'rerate_job_id' not in st.session_state:
+    st.session_state.rerate_job_id = None
+if 'rerate_positions' not in st.session_state:
+    st.session_state.rerate_positions = []
+if 'rerate_messages' not in st.session_state:
+    st.session_state.rerate_messages = []
+if 'summary_inputs' not in st.session_state:
+    st.session_state.summary_inputs = None
+if 'trace' not in st.session_state:
+    st.session_state.trace = Trace(log_path=st.secrets.get("trace_log_path", DEFAULT_TRACE_LOG))
+if 'score_table' not in st.session_state:
+    st.session_state.score_table = None
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Seconds between reruns while a background job is running
+JOB_POLL_INTERVAL = 0.5
 
 # Hardcoded template path
-template_path = "template.docx"
-
-def split_header(header):
-    parts = header.split("-", 1)
-    if len(parts) == 2:
-        return parts[0].rstrip(), parts[1].lstrip()
-    return "", header
-
-def create_spider_chart(df):
-    categories = df['Kategorie'].unique()
-    avg_ratings = df.groupby('Kategorie')['Bewertung (1-5)'].mean().values
-
-    fig = go.Figure(data=[
-        go.Scatterpolar(
-            r=avg_ratings,
-            theta=categories,
-            fill='toself',
-            line=dict(color='rgb(31, 119, 180)'),  # Blue color
-        )
-    ])
-
-    fig.update_layout(
-        polar=dict(
-            radialaxis=dict(
-                visible=True,
-                range=[0, 5]
-            )
-        ),
-        showlegend=False,
-        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
-        plot_bgcolor='rgba(0,0,0,0)'    # Transparent plot area
+template_path = TEMPLATE_PATH
+
+@st.cache_data(max_entries=8, show_spinner="Lese Excel-Datei...")
+def load_survey_workbook(workbook_hash, _data, _trace):
+    # Keyed on the upload's content hash; the raw bytes are not hashed again
+    with _trace.stage("excel_ingest", bytes=len(_data)):
+        return read_survey_workbook(_data)
+
+@st.cache_resource
+def get_llm_cache():
+    # One persistent rating/summary cache per server process
+    return LLMCache(st.secrets.get("llm_cache_path", DEFAULT_CACHE_PATH))
+
+@st.cache_resource
+def get_job_manager():
+    # One worker pool per server process, shared by all sessions
+    return JobManager(st.secrets.get("job_workers", DEFAULT_JOB_WORKERS))
+
+@st.cache_resource
+def get_openai_client():
+    # One pooled API client per server process, so all sessions reuse warm
+    # connections; retries are handled per row by the rating engine
+    return make_client(
+        st.secrets["openai_api_key"],
+        st.secrets.get("openai_base_url"),
+        st.secrets.get("openai_max_connections", MAX_CONNECTIONS),
     )
 
-    return fig
-
-def generate_executive_summary(df):
-    client = OpenAI(api_key=st.secrets["openai_api_key"])
-
-    # Prepare the data for the prompt
-    categories = df.groupby('Kategorie')['Bewertung (1-5)'].mean().reset_index()
-    categories['Bewertung (1-5)'] = categories['Bewertung (1-5)'].round(2)
-    
-    prompt = f"""Erstelle eine Executive Summary basierend auf den folgenden Daten:
-
-Gesamtbewertungen nach Kategorie:
-{categories.to_string(index=False)}
-
-Detaillierte Informationen:
-{df.to_string(index=False)}
-
-Bitte erstelle eine umfassende Executive Summary, die:
-1. Die durchschnittlichen Bewertungen für jede Kategorie hervorhebt
-2. Bemerkenswerte Einzelaspekte aus jeder Kategorie diskutiert
-3. Eine Gesamtbewertung der Leistung des Unternehmens über alle Kategorien hinweg liefert
-
-Die Zusammenfassung sollte prägnant, aber informativ sein und für eine Überprüfung auf Führungsebene geeignet sein. 
-Bitte verwende Schweizer Rechtschreibung und Grammatik. Starte den Bericht nicht mit einem Titel, sonder beginne direkt mit dem Inhalt. Keine fettgedruckte Formatierung."""
+@st.cache_resource(max_entries=8, show_spinner="Lade bereits bewertete Firmen...")
+def get_score_table(workbook_hash, _survey, _cache):
+    # Ratings of all companies of one workbook, shared by all sessions and
+    # seeded with every company whose ratings are all in the LLM cache
+    score_table = ScoreTable()
+    for company, df in cached_ratings(_survey, _cache).items():
+        score_table.set_company(company, df)
+    return score_table
+
+@st.cache_resource
+def get_api_scheduler():
+    # API budget shared fairly by all sessions of this server process; batch
+    # CLI runs on the same API key are not counted against it
+    return ApiScheduler(
+        st.secrets.get("api_requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE),
+        st.secrets.get("api_tokens_per_minute", DEFAULT_TOKENS_PER_MINUTE),
+        st.secrets.get("api_max_in_flight", DEFAULT_MAX_IN_FLIGHT),
+    )
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7
+def run_rating_job(job, client, df, concurrency, batch_size, cache, known, trace):
+    # Background job: rate all rows, keeping finished ratings in job.partial
+    job.partial.update(known)
+    job.update(len(job.partial), len(df))
+    with trace.stage("ratings", cache=cache, rows=len(df), batch_size=batch_size) as stage:
+        return rate_rows(
+            stage.wrap(client),
+            df,
+            concurrency=concurrency,
+            batch_size=batch_size,
+            cache=cache,
+            known=known,
+            on_progress=job.update,
+            on_error=lambda e: job.errors.append(e),
+            on_result=job.partial.__setitem__,
+            on_retry=stage.record_retry,
+            should_stop=lambda: job.cancelled,
         )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Fehler bei der Generierung der Executive Summary: {e}"
 
-def generate_document(spider_chart, df):
+def run_summary_job(job, client, df, cache, token_budget, trace):
+    # Background job: stream the executive summary into job.text
+    # until it is cancelled; closing the stream frees its scheduler slot
+    with trace.stage("summary", cache=cache) as stage:
+        chunks = stream_executive_summary(stage.wrap(client), df, cache=cache, token_budget=token_budget,
+                                          stage=stage)
+        try:
+            for text in chunks:
+                if job.cancelled:
+                    break
+                job.text += text
+        finally:
+            chunks.close()
+    return job.text.strip()
+
+def generate_document(df, trace):
+    # Word and PDF report from the same chart
     try:
-        # Load the Word template
-        template = Document(template_path)
-
-        print("Template loaded successfully")
-        print(f"Number of tables in template: {len(template.tables)}")
-
-        # Save the spider chart to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmpfile:
-            spider_chart.write_image(tmpfile.name, format="png", scale=2)  # Higher resolution
-            
-        # Replace placeholders in the template
-        for paragraph in template.paragraphs:
-            if "{{Executive_Summary}}" in paragraph.text:
-                paragraph.text = paragraph.text.replace("{{Executive_Summary}}", st.session_state.executive_summary)
-            if "{{Company_Name}}" in paragraph.text:
-                paragraph.text = paragraph.text.replace("{{Company_Name}}", st.session_state.selected_company)
-            if "{{Spider_Chart}}" in paragraph.text:
-                # Replace the placeholder with the image
-                run = paragraph.runs[0]
-                run.text = ""
-                run.add_picture(tmpfile.name, width=Inches(6))
-
-        print("Paragraphs processed")
-
-        # Replace placeholders in the entire document
-        for paragraph in template.paragraphs: 
-            for row_index in range(len(df) + 1):  # +1 for header row
-                for col_index in range(len(df.columns)):
-                    placeholder = f"{{{{c{col_index}r{row_index}}}}}"
-                    if placeholder in paragraph.text:
-                        if row_index == 0:
-                            # Header row
-                            replacement = str(df.columns[col_index])
-                        else:
-                            # Data rows
-                            replacement = str(df.iloc[row_index - 1, col_index])
-                        paragraph.text = paragraph.text.replace(placeholder, replacement)
-
-        # Also replace placeholders in table cells
-        for table in template.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for row_index in range(len(df) + 1):  # +1 for header row
-                        for col_index in range(len(df.columns)):
-                            placeholder = f"{{{{c{col_index}r{row_index}}}}}"
-                            if placeholder in cell.text:
-                                if row_index == 0:
-                                    # Header row
-                                    replacement = str(df.columns[col_index])
-                                else:
-                                    # Data rows
-                                    replacement = str(df.iloc[row_index - 1, col_index])
-                                cell.text = cell.text.replace(placeholder, replacement)
-
-        print("Document processing completed")
-
-        # Save the generated document to a buffer
-        buffer = io.BytesIO()
-        template.save(buffer)
-        buffer.seek(0)
-
-        print("Document saved to buffer")
-
-        return buffer
+        with trace.stage("chart_render") as stage:
+            chart_png = get_chart_png(df)
+            stage.record["render_seconds"] = render_seconds(df)
+        with trace.stage("docx_pdf_assembly", rows=len(df)) as stage:
+            return build_reports(
+                chart_png,
+                df,
+                st.session_state.executive_summary,
+                st.session_state.selected_company,
+                template_path,
+                stage,
+            )
     except Exception as e:
-        st.error(f"Fehler bei der Generierung des Word-Dokuments: {e}")
+        st.error(f"Fehler bei der Generierung der Dokumente: {e}")
         print(f"Error in generate_document: {e}")
-        return None
+        return None, None
+
+def show_profiling_panel(trace):
+    # Per-stage timings, API usage and cache hits of the current report
+    records = trace.records()
+    with st.sidebar.expander("Profiling"):
+        if not records:
+            st.caption("Noch keine Messungen.")
+            return
+        columns = ["stage", "seconds", "api_calls", "prompt_tokens", "completion_tokens", "retries", "cache_hits", "cache_misses", "status"]
+        st.dataframe(pd.DataFrame(records)[columns], hide_index=True, use_container_width=True)
+        st.caption(
+            f"Total: {trace.total('seconds'):.1f}s, {trace.total('api_calls')} API calls, "
+            f"{trace.total('prompt_tokens') + trace.total('completion_tokens')} tokens"
+        )
 
 if password == correct_password:
     # File uploader
     uploaded_file = st.sidebar.file_uploader("Upload your Excel file", type=["xlsx"])
 
-    if uploaded_file is not None and not st.session_state.data_loaded:
-        # Read the Excel file
-        df = pd.read_excel(uploaded_file, sheet_name="Sheet1", header=0)
-
-        # Create a dropdown with company names from column F (index 5)
-        company_names = df.iloc[:, 5].dropna().unique()
-        selected_company = st.sidebar.selectbox("Select a company", company_names)
-
-        if st.sidebar.button("Load Data"):
-            # Store the selected company name in session state
-            st.session_state.selected_company = selected_company
+    # Shared worker pool for rating and summary jobs
+    job_manager = get_job_manager()
+
+    # Persistent cache for ratings and executive summaries
+    llm_cache = get_llm_cache()
+    cache_stats = llm_cache.stats()
+    st.sidebar.caption(f"LLM cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
+    # All API requests of all sessions queue here for the global rate limits
+    api_scheduler = get_api_scheduler()
+    queue_stats = api_scheduler.stats()
+    st.sidebar.caption(
+        f"API queue: {queue_stats['in_flight']} in flight, {queue_stats['queued']} waiting "
+        f"({queue_stats['interactive_sessions'] + queue_stats['bulk_sessions']} sessions), "
+        f"wait p50 {queue_stats['interactive_wait_p50']:.1f}s / p95 {queue_stats['interactive_wait_p95']:.1f}s"
+    )
 
-            # Filter the dataframe for the selected company
-            selected_row = df[df.iloc[:, 5] == selected_company].iloc[0]
+    # Timings of the current report
+    show_profiling_panel(st.session_state.trace)
 
-            # Process the headers and create the new dataframe
-            headers = df.columns[7:]  # Start from column H (index 7)
-            answers = selected_row.iloc[7:]  # Corresponding answers
+    # Upper limit for the size of the executive summary prompt
+    summary_token_budget = st.secrets.get("summary_token_budget", SUMMARY_TOKEN_BUDGET)
 
-            # Split headers into Kategorie and Frage
-            kategorien, fragen = zip(*[split_header(header) for header in headers])
+    # Number of rating requests sent to the API at the same time
+    rating_concurrency = st.sidebar.number_input("Parallel rating requests", min_value=1, max_value=32, value=DEFAULT_CONCURRENCY)
 
-            # Create a new dataframe with Kategorie, Frage, and Answer
-            new_df = pd.DataFrame({
-                "Kategorie": kategorien,
-                "Frage": fragen,
-                "Antwort": answers,
-                "Bewertung (1-5)": [""] * len(answers)  # Empty column for ratings
-            })
+    # Questions of the same Kategorie rated together in one request (1 = one request per question)
+    rating_batch_size = st.sidebar.number_input("Questions per rating request", min_value=1, max_value=MAX_BATCH_SIZE, value=DEFAULT_BATCH_SIZE)
 
-            # Store the new dataframe in session state
-            st.session_state.new_df = new_df
-            st.session_state.data_loaded = True
-            st.session_state.ratings_generated = False
-            st.session_state.edits_confirmed = False
+    if uploaded_file is not None and not st.session_state.data_loaded:
+        # Read the Excel file, parsed only once per distinct upload
+        data = uploaded_file.getvalue()
+        workbook_hash = content_hash(data)
+        survey = load_survey_workbook(workbook_hash, data, st.session_state.trace)
+
+        if survey.empty:
+            st.error("Die Excel-Datei enthält keine Firmen (Spalte F) oder keine Fragen (ab Spalte H) in Sheet1.")
+        else:
+            # Create a dropdown with company names from column F (index 5)
+            company_names = survey.companies
+            selected_company = st.sidebar.selectbox("Select a company", company_names)
+
+            if st.sidebar.button("Load Data"):
+                # Store the selected company name in session state
+                st.session_state.selected_company = selected_company
+
+                # Stage timings of this company's report; keep the workbook parse
+                st.session_state.trace.name = str(selected_company)
+
+                # Create a new dataframe with Kategorie, Frage, Antwort and an empty rating column
+                new_df = survey.company_frame(selected_company)
+
+                # Store the new dataframe in session state
+                st.session_state.new_df = new_df
+
+                # Rated companies of the same workbook to compare with
+                st.session_state.score_table = get_score_table(workbook_hash, survey, llm_cache)
+                st.session_state.data_loaded = True
+                st.session_state.ratings_generated = False
+                st.session_state.edits_confirmed = False
+                st.session_state.rerate_messages = []
 
     if st.session_state.data_loaded and st.session_state.new_df is not None:
         st.header(f"Data for {st.session_state.selected_company}")
+
+        # Errors of the last re-rating, kept until the next one starts
+        for message in st.session_state.rerate_messages:
+            st.error(message)
         
         # Create a placeholder for the dataframe
         table_placeholder = st.empty()
@@ -227,53 +266,75 @@ if password == correct_password:
             # Display the initial dataframe
             table_placeholder.dataframe(st.session_state.new_df, use_container_width=True, hide_index=True)
 
-            if st.button("Generate Ratings"):
-                # Initialize the OpenAI client
-                client = OpenAI(api_key=st.secrets["openai_api_key"])
-
-                # Generate ratings using GPT API
-                ratings = []
-                progress_bar = st.progress(0)
-                total_rows = len(st.session_state.new_df)
-                
-                for counter, (_, row) in enumerate(st.session_state.new_df.iterrows(), 1):
-                    prompt = f"""Erstelle mir eine Bewertung des folgenden Textes, nach einem Punkte System 1-5 (1 schlecht und 5 gut):
-Kategorie: {row['Kategorie']}
-Frage: {row['Frage']}
-Antwort: {row['Antwort']}
-Gib nur eine ganze Zahl zwischen 1 und 5 zurück. Wenn keine Antwort vorhanden ist oder die Daten für eine Bewertung unzureichend sind, gib 1 zurück."""
-                    try:
-                        response = client.chat.completions.create(
-                            model="gpt-4o",
-                            messages=[
-                                {
-                                    "role": "user",
-                                    "content": prompt
-                                }
-                            ],
-                            temperature=0.7
-                        )
-                        rating = response.choices[0].message.content.strip()
-                        # Ensure the rating is an integer between 1 and 5
-                        rating = max(1, min(5, int(float(rating))))
-                        ratings.append(rating)
-                    except Exception as e:
-                        st.error(f"Fehler bei der Generierung der Bewertung: {e}")
-                        ratings.append(1)  # Default to 1 in case of an error
-                    
-                    # Update progress bar
-                    progress_bar.progress(counter / total_rows)
-
-                # Add ratings to the dataframe
-                st.session_state.new_df["Bewertung (1-5)"] = ratings
-
-                # Remove the progress bar
-                progress_bar.empty()
+            # Ratings run as a background job, so they survive reruns and reconnects
+            rating_job = job_manager.get(st.session_state.rating_job_id)
+
+            if rating_job is not None and rating_job.active:
+                st.progress(rating_job.progress, text=f"Bewertungen: {rating_job.done} von {rating_job.total or len(st.session_state.new_df)}")
+                time.sleep(JOB_POLL_INTERVAL)
+                st.rerun()
+
+            elif rating_job is not None and rating_job.status == DONE:
+                for e in rating_job.errors:
+                    st.error(f"Fehler bei der Generierung der Bewertung: {e}")
 
+                # Add ratings to the dataframe and remember them as the last rated state
+                st.session_state.new_df["Bewertung (1-5)"] = rating_job.result
+                st.session_state.rated_df = st.session_state.new_df.copy()
+                st.session_state.rating_job_id = None
                 st.session_state.ratings_generated = True
 
+            else:
+                if rating_job is not None:
+                    st.error(f"Fehler bei der Generierung der Bewertungen: {rating_job.error}")
+
+                if st.button("Generate Ratings"):
+                    client = api_scheduler.wrap(get_openai_client(), st.session_state.session_id)
+
+                    # Generate ratings using GPT API, several requests in parallel; a
+                    # failed job's finished ratings are reused instead of starting over
+                    st.session_state.rating_job_id = job_manager.submit(
+                        "ratings",
+                        run_rating_job,
+                        client,
+                        st.session_state.new_df.copy(),
+                        rating_concurrency,
+                        rating_batch_size,
+                        llm_cache,
+                        dict(rating_job.partial) if rating_job is not None else {},
+                        st.session_state.trace,
+                    )
+                    st.rerun()
+
         if st.session_state.ratings_generated and not st.session_state.edits_confirmed:
-            # Allow editing of ratings
+            rerate_job = job_manager.get(st.session_state.rerate_job_id)
+
+            if rerate_job is not None and rerate_job.active:
+                # Only the rows with changed answers are being rated again
+                table_placeholder.dataframe(st.session_state.new_df, use_container_width=True, hide_index=True)
+                st.progress(rerate_job.progress, text=f"Neu bewertete Antworten: {rerate_job.done} von {len(st.session_state.rerate_positions)}")
+                time.sleep(JOB_POLL_INTERVAL)
+                st.rerun()
+
+            elif rerate_job is not None:
+                # Shown after the rerun below, see the top of the page
+                if rerate_job.status == DONE:
+                    st.session_state.rerate_messages = [
+                        f"Fehler bei der Generierung der Bewertung, Bewertung {FALLBACK_RATING} gesetzt: {e}"
+                        for e in rerate_job.errors
+                    ]
+                    ratings = st.session_state.new_df["Bewertung (1-5)"].tolist()
+                    for position, rating in zip(st.session_state.rerate_positions, rerate_job.result):
+                        ratings[position] = rating
+                    st.session_state.new_df["Bewertung (1-5)"] = ratings
+                    st.session_state.edits_confirmed = True
+                else:
+                    st.session_state.rerate_messages = [f"Fehler bei der Generierung der Bewertungen: {rerate_job.error}"]
+                st.session_state.rerate_job_id = None
+                st.session_state.rerate_positions = []
+                st.rerun()
+
+            # Allow editing of answers and ratings
             edited_df = st.data_editor(
                 st.session_state.new_df,
                 column_config={
@@ -287,45 +348,132 @@ Gib nur eine ganze Zahl zwischen 1 und 5 zurück. Wenn keine Antwort vorhanden i
                 },
                 use_container_width=True,
                 hide_index=True,
-                disabled=["Kategorie", "Frage", "Antwort"],
+                disabled=["Kategorie", "Frage"],
             )
 
             # Update the session state with the edited dataframe
             st.session_state.new_df = edited_df
 
             if st.button("Confirm Edits"):
-                st.session_state.edits_confirmed = True
+                # Rows whose answer changed are rated again, unless their rating
+                # was also set by hand; all other ratings are kept as they are
+                rated_df = st.session_state.rated_df if st.session_state.rated_df is not None else edited_df
+                changed_answers = changed_rows(rated_df, edited_df, "Antwort")
+                changed_ratings = set(changed_rows(rated_df, edited_df, "Bewertung (1-5)"))
+                rerate_positions = [position for position in changed_answers if position not in changed_ratings]
+
+                st.session_state.rerate_messages = []
+                if rerate_positions:
+                    client = api_scheduler.wrap(get_openai_client(), st.session_state.session_id)
+                    st.session_state.rerate_positions = rerate_positions
+                    st.session_state.rerate_job_id = job_manager.submit(
+                        "ratings",
+                        run_rating_job,
+                        client,
+                        edited_df.iloc[rerate_positions].reset_index(drop=True),
+                        rating_concurrency,
+                        rating_batch_size,
+                        llm_cache,
+                        {},
+                        st.session_state.trace,
+                    )
+                else:
+                    st.session_state.edits_confirmed = True
+                st.rerun()
 
         if st.session_state.edits_confirmed:
             # Convert ratings to integers and handle any non-numeric values
-            st.session_state.new_df['Bewertung (1-5)'] = pd.to_numeric(st.session_state.new_df['Bewertung (1-5)'], errors='coerce').fillna(1).clip(1, 5).astype(int)
+            st.session_state.new_df = normalize_ratings(st.session_state.new_df)
+            st.session_state.rated_df = st.session_state.new_df.copy()
+
+            # The summary is only regenerated when its inputs have changed
+            inputs = summary_inputs_key(st.session_state.new_df)
+            if inputs != st.session_state.summary_inputs:
+                st.session_state.summary_inputs = inputs
+                st.session_state.executive_summary = ""
+                # A summary still being written for the old inputs is stopped
+                job_manager.cancel(st.session_state.summary_job_id)
+                st.session_state.summary_job_id = None
+
+            # Render the chart image for the Word document in the background
+            render_chart_async(st.session_state.new_df)
 
             # Create and display the spider chart
             st.subheader("Category Ratings Overview")
             spider_chart = create_spider_chart(st.session_state.new_df)
             st.plotly_chart(spider_chart, use_container_width=True)
 
-            # Generate and display the executive summary
-            if 'executive_summary' not in st.session_state or not st.session_state.executive_summary:
-                with st.spinner("Generiere Executive Summary..."):
-                    st.session_state.executive_summary = generate_executive_summary(st.session_state.new_df)
-            
+            # Compare with all other rated companies of the same workbook
+            score_table = st.session_state.score_table
+            if score_table is not None:
+                score_table.set_company(st.session_state.selected_company, st.session_state.new_df)
+                if len(score_table) > 1:
+                    profile = score_table.company_profile(st.session_state.selected_company)
+                    st.subheader("Peer Comparison")
+                    st.caption(f"Verglichen mit {len(score_table) - 1} weiteren bewerteten Firmen dieser Excel-Datei")
+                    comparison_chart = comparison_spider_chart(profile["Bewertung"], profile["Peer-Durchschnitt"], st.session_state.selected_company)
+                    st.plotly_chart(comparison_chart, use_container_width=True)
+                    st.dataframe(profile.round(1), use_container_width=True)
+
+            # Generate the executive summary in the background, showing the text as it arrives
             st.subheader("Executive Summary")
+            if 'executive_summary' not in st.session_state or not st.session_state.executive_summary:
+                summary_job = job_manager.get(st.session_state.summary_job_id)
+                if summary_job is None:
+                    client = api_scheduler.wrap(
+                        get_openai_client().with_options(max_retries=SUMMARY_MAX_RETRIES),
+                        st.session_state.session_id,
+                    )
+                    st.session_state.summary_job_id = job_manager.submit(
+                        "summary",
+                        run_summary_job,
+                        client,
+                        st.session_state.new_df.copy(),
+                        llm_cache,
+                        summary_token_budget,
+                        st.session_state.trace,
+                    )
+                    summary_job = job_manager.get(st.session_state.summary_job_id)
+
+                if summary_job.active:
+                    st.write(summary_job.text or "Generiere Executive Summary...")
+                    time.sleep(JOB_POLL_INTERVAL)
+                    st.rerun()
+                elif summary_job.status == DONE:
+                    st.session_state.executive_summary = summary_job.result
+                else:
+                    st.session_state.executive_summary = f"Fehler bei der Generierung der Executive Summary: {summary_job.error}"
+                st.session_state.summary_job_id = None
+
             st.write(st.session_state.executive_summary)
 
+            if st.button("Edit answers and ratings"):
+                st.session_state.edits_confirmed = False
+                st.rerun()
+
             # Consolidated button for generation and download
-            if st.button("Generate and download Word document"):
-                with st.spinner("Generiere Dokument..."):
-                    doc_buffer = generate_document(spider_chart, st.session_state.new_df)
+            if st.button("Generate and download Word and PDF documents"):
+                with st.spinner("Generiere Dokumente..."):
+                    doc_buffer, pdf_buffer = generate_document(st.session_state.new_df, st.session_state.trace)
                     if doc_buffer:
                         st.download_button(
                             label="Klicken Sie hier, um das generierte Dokument herunterzuladen",
                             data=doc_buffer,
                             file_name="generated_report.docx",
                             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            key="download_button"
+                            key="download_button",
+                            # Without a rerun, so the other button stays on the page
+                            on_click="ignore"
+                        )
+                        st.download_button(
+                            label="Klicken Sie hier, um den Bericht als PDF herunterzuladen",
+                            data=pdf_buffer,
+                            file_name="generated_report.pdf",
+                            mime="application/pdf",
+                            key="download_pdf_button",
+                            on_click="ignore"
                         )
-                        st.success("Dokument erfolgreich generiert! Klicken Sie auf den Download-Button oben, um es zu speichern.")
+                        st.success("Dokumente erfolgreich generiert! Klicken Sie auf die Download-Buttons oben, um sie zu speichern.")
                     else:
                         st.error("Fehler bei der Generierung des Dokuments. Bitte versuchen Sie es erneut.")
 
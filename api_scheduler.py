@@ -0,0 +1,249 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from prompt_budget import count_tokens
+
+# Priority classes, served in this order: a user waiting for one company's
+# ratings or summary goes ahead of bulk report generation. Only requests of
+# the same scheduler, i.e. the same process, are ordered this way; the app
+# submits interactive work and the batch CLI bulk work to schedulers of
+# their own, so the two never compete in one queue.
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Default budgets of the whole server process (OpenAI tier 2 limits for
+# gpt-4o); set them to the organisation's actual limits
+DEFAULT_REQUESTS_PER_MINUTE = 5000
+DEFAULT_TOKENS_PER_MINUTE = 450000
+DEFAULT_MAX_IN_FLIGHT = 64
+
+# Completion tokens reserved for a request that does not set max_tokens;
+# the reservation is corrected with the actual usage once it is known
+EXPECTED_COMPLETION_TOKENS = 256
+
+# Wait times kept for the queue statistics
+WAIT_SAMPLES = 1000
+
+
+class TokenBucket:
+    # Holds up to capacity units and refills at capacity per minute. Not
+    # thread-safe on its own, the scheduler's lock guards it.
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def cost(self, amount):
+        # A request larger than the bucket would wait forever otherwise
+        return min(float(amount), self.capacity)
+
+    def delay(self, amount):
+        # Seconds until amount units are available
+        missing = self.cost(amount) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount):
+        self.level -= self.cost(amount)
+
+    def adjust(self, amount):
+        # Positive amounts are charged, negative ones refunded
+        self.level = min(self.capacity, self.level - amount)
+
+
+class _Ticket:
+    def __init__(self, session, priority, tokens):
+        self.session = session
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class ApiScheduler:
+    # Admission control for all API requests of one server process. Every
+    # request waits for a ticket: tickets are granted while the global
+    # requests-per-minute and tokens-per-minute budgets and the limit on
+    # requests in flight allow it, interactive before bulk, and round-robin
+    # across sessions within a priority, so one session's large job cannot
+    # starve the others. The budgets hold for this process only: nothing is
+    # shared with other processes, so the app, every batch CLI worker and any
+    # other client of the same API key must be given separate shares of the
+    # organisation's limits.
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.in_flight = 0
+        self.granted = 0
+        # priority -> OrderedDict(session -> deque of waiting tickets)
+        self._queues = {INTERACTIVE: OrderedDict(), BULK: OrderedDict()}
+        self._waits = {INTERACTIVE: deque(maxlen=WAIT_SAMPLES), BULK: deque(maxlen=WAIT_SAMPLES)}
+        self._condition = threading.Condition()
+
+    def _next_ticket(self):
+        for priority in (INTERACTIVE, BULK):
+            sessions = self._queues[priority]
+            if sessions:
+                return sessions[next(iter(sessions))][0]
+        return None
+
+    def _dispatch(self):
+        # Grant tickets in scheduling order while capacity lasts; returns the
+        # seconds until the next ticket could be granted, None if nothing waits
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        while True:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return None
+            if self.in_flight >= self.max_in_flight:
+                # A release will wake the waiters up
+                return None
+            delay = max(self.requests.delay(1), self.tokens.delay(ticket.tokens))
+            if delay > 0:
+                return delay
+
+            # Grant and move the session to the back of its round-robin queue
+            sessions = self._queues[ticket.priority]
+            queue = sessions[ticket.session]
+            queue.popleft()
+            if queue:
+                sessions.move_to_end(ticket.session)
+            else:
+                del sessions[ticket.session]
+            self.requests.take(1)
+            self.tokens.take(ticket.tokens)
+            self.in_flight += 1
+            self.granted += 1
+            self._waits[ticket.priority].append(now - ticket.enqueued)
+            ticket.granted = True
+            self._condition.notify_all()
+
+    def acquire(self, session, priority=INTERACTIVE, tokens=0):
+        # Block until the request may be sent; returns the seconds waited.
+        # Every acquire must be followed by a release.
+        ticket = _Ticket(session, priority, tokens)
+        with self._condition:
+            self._queues[priority].setdefault(session, deque()).append(ticket)
+            while True:
+                delay = self._dispatch()
+                if ticket.granted:
+                    return time.monotonic() - ticket.enqueued
+                self._condition.wait(delay)
+
+    def release(self, reserved_tokens=0, used_tokens=None):
+        # Free the request's slot; with the actual usage known, the tokens
+        # reserved for it are corrected
+        with self._condition:
+            self.in_flight -= 1
+            if used_tokens is not None:
+                self.tokens.adjust(used_tokens - self.tokens.cost(reserved_tokens))
+            self._dispatch()
+            self._condition.notify_all()
+
+    def stats(self):
+        # Queue depth and wait times, e.g. for sizing the API tier
+        with self._condition:
+            stats = {
+                "in_flight": self.in_flight,
+                "granted": self.granted,
+                "requests_available": int(self.requests.level),
+                "tokens_available": int(self.tokens.level),
+            }
+            for priority, name in PRIORITY_NAMES.items():
+                sessions = self._queues[priority]
+                waits = sorted(self._waits[priority])
+                stats[f"{name}_queued"] = sum(len(queue) for queue in sessions.values())
+                stats[f"{name}_sessions"] = len(sessions)
+                stats[f"{name}_wait_p50"] = waits[len(waits) // 2] if waits else 0.0
+                stats[f"{name}_wait_p95"] = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+                stats[f"{name}_wait_max"] = waits[-1] if waits else 0.0
+            stats["queued"] = stats["interactive_queued"] + stats["bulk_queued"]
+            return stats
+
+    def wrap(self, client, session, priority=INTERACTIVE):
+        # OpenAI client whose chat completions wait for this scheduler
+        return ScheduledClient(client, self, session, priority)
+
+
+def estimate_tokens(kwargs):
+    # Tokens a chat completion request will use at most, roughly
+    model = kwargs.get("model", "")
+    prompt = sum(count_tokens(str(message.get("content") or ""), model) for message in kwargs.get("messages", []))
+    completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or EXPECTED_COMPLETION_TOKENS
+    return prompt + completion
+
+
+def _total_tokens(usage):
+    if usage is None:
+        return None
+    return (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+
+
+class _ScheduledCompletions:
+    def __init__(self, completions, scheduler, session, priority):
+        self._completions = completions
+        self._scheduler = scheduler
+        self._session = session
+        self._priority = priority
+
+    def create(self, **kwargs):
+        tokens = estimate_tokens(kwargs)
+        self._scheduler.acquire(self._session, self._priority, tokens)
+        try:
+            response = self._completions.create(**kwargs)
+        except BaseException:
+            self._scheduler.release(tokens)
+            raise
+        if kwargs.get("stream"):
+            return _ScheduledStream(response, self._scheduler, tokens)
+        self._scheduler.release(tokens, _total_tokens(getattr(response, "usage", None)))
+        return response
+
+
+class _ScheduledStream:
+    # Keeps the request's slot until the stream is exhausted or closed
+    def __init__(self, stream, scheduler, tokens):
+        self._stream = stream
+        self._scheduler = scheduler
+        self._tokens = tokens
+        self._used = None
+        self._released = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler.release(self._tokens, self._used)
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                used = _total_tokens(getattr(chunk, "usage", None))
+                if used is not None:
+                    self._used = used
+                yield chunk
+        finally:
+            self._release()
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class ScheduledClient:
+    def __init__(self, client, scheduler, session, priority=INTERACTIVE):
+        self.completions = _ScheduledCompletions(client.chat.completions, scheduler, session, priority)
+        self.chat = self
@@ -0,0 +1,344 @@
+import argparse
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from api_scheduler import ApiScheduler, BULK, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from chart_render import render_chart_async, render_seconds, wait_chart
+from docx_stream import get_streaming_template
+from excel_ingest import read_survey_workbook
+from llm_cache import LLMCache, DEFAULT_CACHE_PATH
+from openai_client import make_client, SUMMARY_MAX_RETRIES
+from rating_engine import rate_rows, DEFAULT_CONCURRENCY, DEFAULT_BATCH_SIZE
+from scoring import ScoreTable, BENCHMARK_PERCENTILES
+from report_core import (
+    TEMPLATE_PATH,
+    normalize_ratings,
+    generate_executive_summary,
+    build_document,
+    build_reports,
+    category_averages,
+    write_document,
+)
+from pdf_report import build_pdf, merge_pdfs
+from tracing import Trace, DEFAULT_TRACE_LOG
+
+# Ways of writing the reports, see run_batch
+DOCX_WRITERS = ("stream", "python-docx")
+
+
+class WorkbookError(ValueError):
+    # The workbook cannot be processed as asked, reported as a usage error
+    pass
+
+
+# Per-process state of the worker pool, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(api_key, base_url, cache_path, template_path, concurrency, batch_size, trace_log,
+                 requests_per_minute, tokens_per_minute, docx_writer, pdf):
+    # One pooled client per worker process; rating retries are handled per
+    # row by the rating engine. Each worker gets its share of the API budget.
+    client = make_client(api_key, base_url, max_connections=max(concurrency, 1))
+    scheduler = ApiScheduler(requests_per_minute, tokens_per_minute, max_in_flight=max(concurrency, 1))
+    _worker["scheduler"] = scheduler
+    _worker["client"] = scheduler.wrap(client, os.getpid(), BULK)
+    _worker["summary_client"] = scheduler.wrap(client.with_options(max_retries=SUMMARY_MAX_RETRIES), os.getpid(), BULK)
+    _worker["cache"] = LLMCache(cache_path) if cache_path else None
+    _worker["template_path"] = template_path
+    _worker["concurrency"] = concurrency
+    _worker["batch_size"] = batch_size
+    _worker["trace_log"] = trace_log
+    _worker["docx_writer"] = docx_writer
+    _worker["pdf"] = pdf
+
+
+def _report_for_company(company, company_df):
+    # Runs in a worker process: rate, summarise and render one company
+    trace = Trace(company, _worker["trace_log"])
+    cache = _worker["cache"]
+    errors = []
+
+    with trace.stage("ratings", cache=cache, rows=len(company_df), batch_size=_worker["batch_size"]) as stage:
+        ratings = rate_rows(
+            stage.wrap(_worker["client"]),
+            company_df,
+            concurrency=_worker["concurrency"],
+            batch_size=_worker["batch_size"],
+            cache=cache,
+            on_error=lambda e: errors.append(str(e)),
+            on_retry=stage.record_retry,
+        )
+    company_df["Bewertung (1-5)"] = ratings
+    company_df = normalize_ratings(company_df)
+
+    # The chart renders in the background while the summary is generated
+    chart = render_chart_async(company_df)
+    with trace.stage("summary", cache=cache) as stage:
+        try:
+            executive_summary = generate_executive_summary(stage.wrap(_worker["summary_client"]), company_df,
+                                                           cache=cache, raise_errors=True, stage=stage)
+        except Exception as e:
+            # OpenAI errors cannot be unpickled in the parent, which would
+            # break the whole pool; the company is reported as failed
+            raise RuntimeError(f"Executive summary failed: {e}") from None
+    with trace.stage("chart_render") as stage:
+        chart_png = wait_chart(chart)
+        stage.record["render_seconds"] = render_seconds(company_df)
+    document = pdf = None
+    if _worker["docx_writer"] == "python-docx" and _worker["pdf"]:
+        with trace.stage("docx_pdf_assembly", rows=len(company_df)) as stage:
+            buffer, pdf_buffer = build_reports(chart_png, company_df, executive_summary, str(company),
+                                               _worker["template_path"], stage)
+        document, pdf = buffer.getvalue(), pdf_buffer.getvalue()
+    elif _worker["docx_writer"] == "python-docx":
+        with trace.stage("docx_assembly", rows=len(company_df)) as stage:
+            buffer = build_document(chart_png, company_df, executive_summary, str(company), _worker["template_path"],
+                                    stage)
+        document = buffer.getvalue()
+    elif _worker["pdf"]:
+        # The parent streams the Word document meanwhile
+        with trace.stage("pdf_assembly", rows=len(company_df)):
+            pdf = build_pdf(chart_png, company_df, executive_summary, str(company),
+                            category_averages(company_df)).getvalue()
+
+    return {
+        "company": company,
+        # None with the streaming writer, the parent writes the document
+        "document": document,
+        "pdf": pdf,
+        "chart_png": chart_png,
+        "executive_summary": executive_summary,
+        "api_calls": trace.total("api_calls"),
+        "errors": errors,
+        "seconds": trace.total("seconds"),
+        "ratings": company_df["Bewertung (1-5)"].tolist(),
+        "queue_wait_p95": _worker["scheduler"].stats()["bulk_wait_p95"],
+    }
+
+
+def report_file_name(company):
+    # File system safe name for a company's report
+    name = re.sub(r"[^\w\-. ]+", "_", str(company)).strip(" .")
+    return f"{name or 'report'}.docx"
+
+
+def write_report(target, company, frame, result, template_path=TEMPLATE_PATH):
+    # Write a worker's report into target; with the streaming writer it is
+    # assembled right here, straight into the output file or zip member
+    if result["document"] is not None:
+        target.write(result["document"])
+    else:
+        write_document(target, result["chart_png"], frame, result["executive_summary"], str(company), template_path)
+
+
+def write_scores(score_table, path):
+    # One row per company with its category means and overall mean, followed
+    # by the benchmark rows across all companies
+    aggregates = score_table.aggregates()
+    scores = aggregates.means.assign(Gesamt=aggregates.overall)
+    benchmarks = aggregates.benchmarks.copy()
+    benchmarks["Gesamt"] = [aggregates.overall.mean()] + [
+        aggregates.overall.quantile(percentile / 100) for _, percentile in BENCHMARK_PERCENTILES
+    ]
+    pd.concat([scores, benchmarks]).round(2).to_csv(path, index_label="Firma")
+
+
+def run_batch(workbook, output, companies=None, workers=None, concurrency=DEFAULT_CONCURRENCY,
+              batch_size=DEFAULT_BATCH_SIZE, api_key=None, base_url=None, cache_path=DEFAULT_CACHE_PATH,
+              template_path=TEMPLATE_PATH, trace_log=DEFAULT_TRACE_LOG,
+              requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+              scores_path=None, docx_writer="stream", pdf=False, binder_path=None, log=print):
+    # Read the workbook once, build every company's frame up front and let
+    # the process pool do the rating and document generation in parallel.
+    # output is a directory, or a .zip file collecting all reports. The
+    # requests and tokens per minute are split evenly between the workers,
+    # each with a scheduler of its own; a running app on the same API key
+    # has its own budget, which these limits must leave room for.
+    # With scores_path, the category means of all companies and the peer
+    # benchmarks are written to that CSV file. docx_writer is "stream" to
+    # write the reports at zip level or "python-docx" to build them in the
+    # workers with the python-docx object model. With pdf, every report is
+    # written as a PDF as well; with binder_path, the PDF reports of all
+    # companies are merged into that one file, in workbook order.
+    started = time.time()
+    with open(workbook, "rb") as f:
+        survey = read_survey_workbook(f.read())
+    if survey.empty:
+        raise WorkbookError(f"No companies or questions in {workbook}")
+    if companies is None:
+        companies = survey.companies
+    else:
+        # Names from the command line are strings, workbook cells may not be
+        by_name = {str(company): company for company in survey.companies}
+        unknown = [str(company) for company in companies if str(company) not in by_name]
+        if unknown:
+            raise WorkbookError(f"Not in the workbook: {', '.join(unknown)}")
+        companies = [by_name[str(company)] for company in companies]
+    frames = {company: survey.company_frame(company) for company in companies}
+
+    if docx_writer == "stream":
+        # Reports are written here; a broken template fails before any API call
+        get_streaming_template(template_path)
+
+    to_zip = output.lower().endswith(".zip")
+    archive = zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) if to_zip else None
+    if not to_zip:
+        os.makedirs(output, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    worker_rpm = requests_per_minute / workers
+    worker_tpm = tokens_per_minute / workers
+
+    results = []
+    failed = []
+    used_names = set()
+    # company -> PDF bytes, for the binder
+    pdfs = {}
+    score_table = ScoreTable()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(api_key, base_url, cache_path, template_path, concurrency, batch_size, trace_log,
+                      worker_rpm, worker_tpm, docx_writer, bool(pdf or binder_path)),
+        ) as executor:
+            futures = {
+                executor.submit(_report_for_company, company, frame): company
+                for company, frame in frames.items()
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                company = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed.append(company)
+                    log(f"[{done}/{len(futures)}] {company}: failed: {e}")
+                    continue
+
+                # Avoid overwriting reports of companies whose names collide
+                name = report_file_name(company)
+                base, suffix = os.path.splitext(name)
+                counter = 2
+                while name in used_names:
+                    name = f"{base}_{counter}{suffix}"
+                    counter += 1
+                used_names.add(name)
+
+                frame = frames[company].copy()
+                frame["Bewertung (1-5)"] = result["ratings"]
+                if archive is not None:
+                    # Stored, a .docx is compressed already
+                    with archive.open(zipfile.ZipInfo(name, time.localtime()[:6]), "w") as f:
+                        write_report(f, company, frame, result, template_path)
+                else:
+                    with open(os.path.join(output, name), "wb") as f:
+                        write_report(f, company, frame, result, template_path)
+                if pdf:
+                    pdf_name = os.path.splitext(name)[0] + ".pdf"
+                    if archive is not None:
+                        archive.writestr(zipfile.ZipInfo(pdf_name, time.localtime()[:6]), result["pdf"])
+                    else:
+                        with open(os.path.join(output, pdf_name), "wb") as f:
+                            f.write(result["pdf"])
+                if binder_path:
+                    pdfs[company] = result["pdf"]
+                # Only the counters are kept, not every report
+                del result["document"], result["chart_png"], result["pdf"]
+                results.append(result)
+                score_table.set_company(company, frame)
+                log(
+                    f"[{done}/{len(futures)}] {company}: {result['api_calls']} API calls, {result['seconds']:.1f}s "
+                    f"(queue wait p95 {result['queue_wait_p95']:.1f}s)"
+                )
+                for error in result["errors"]:
+                    log(f"    rating error: {error}")
+    finally:
+        if archive is not None:
+            archive.close()
+
+    if binder_path and pdfs:
+        with open(binder_path, "wb") as f:
+            merge_pdfs([(company, pdfs[company]) for company in frames if company in pdfs], f)
+        log(f"Merged {len(pdfs)} PDF reports into {binder_path}")
+
+    if scores_path and len(score_table):
+        write_scores(score_table, scores_path)
+        log(f"Wrote category scores of {len(score_table)} companies to {scores_path}")
+
+    elapsed = time.time() - started
+    api_calls = sum(result["api_calls"] for result in results)
+    summary = {
+        "companies": len(results),
+        "failed": failed,
+        "seconds": elapsed,
+        "companies_per_minute": len(results) / elapsed * 60 if elapsed else 0.0,
+        "api_calls": api_calls,
+        "api_calls_per_company": api_calls / len(results) if results else 0.0,
+    }
+    log(
+        f"Generated {summary['companies']} reports in {elapsed:.1f}s "
+        f"({summary['companies_per_minute']:.1f} companies/min, "
+        f"{summary['api_calls_per_company']:.1f} API calls/company, {len(failed)} failed)"
+    )
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Word reports for all companies of a survey workbook.")
+    parser.add_argument("workbook", help="Survey workbook (.xlsx) with the companies in column F")
+    parser.add_argument("output", help="Output directory, or a .zip file to collect all reports")
+    parser.add_argument("--company", action="append", dest="companies", help="Only process this company (repeatable)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Parallel rating requests per company")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Questions per rating request")
+    parser.add_argument("--template", default=TEMPLATE_PATH, help="Word template")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="LLM cache file ('' to disable)")
+    parser.add_argument("--trace-log", default=DEFAULT_TRACE_LOG, help="JSON-lines file for per-stage timings ('' to disable)")
+    parser.add_argument("--scores", help="CSV file for the category scores of all companies and peer benchmarks")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help="API requests per minute, for all workers together (not shared with the app)")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TOKENS_PER_MINUTE, help="API tokens per minute, for all workers together (not shared with the app)")
+    parser.add_argument("--docx-writer", choices=DOCX_WRITERS, default="stream",
+                        help="Write reports at zip level (stream) or with the python-docx object model")
+    parser.add_argument("--pdf", action="store_true", help="Write every report as a PDF as well")
+    parser.add_argument("--binder", help="Merge the PDF reports of all companies into this PDF file")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"), help="OpenAI-compatible API base URL")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("OPENAI_API_KEY is not set")
+
+    try:
+        summary = run_batch(
+            args.workbook,
+            args.output,
+            companies=args.companies,
+            workers=args.workers,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            api_key=api_key,
+            base_url=args.base_url,
+            cache_path=args.cache,
+            template_path=args.template,
+            trace_log=args.trace_log,
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+            scores_path=args.scores,
+            docx_writer=args.docx_writer,
+            pdf=args.pdf,
+            binder_path=args.binder,
+        )
+    except WorkbookError as e:
+        parser.error(str(e))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
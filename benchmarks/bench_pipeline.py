@@ -0,0 +1,189 @@
+import argparse
+import json
+import struct
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from api_scheduler import ApiScheduler, DEFAULT_MAX_IN_FLIGHT
+from benchmarks.stub_server import StubOpenAI
+from benchmarks.synthetic import make_survey_workbook
+from chart_render import get_chart_png
+from excel_ingest import read_survey_workbook
+from llm_cache import LLMCache
+from openai_client import make_client, SUMMARY_MAX_RETRIES
+from rating_engine import rate_rows, DEFAULT_CONCURRENCY, DEFAULT_BATCH_SIZE
+from report_core import TEMPLATE_PATH, normalize_ratings, generate_executive_summary, build_document
+from tracing import Trace
+
+# Stages in pipeline order, as named in the trace records
+STAGES = ["excel_ingest", "ratings", "summary", "chart_render", "docx_assembly", "company"]
+
+
+def blank_png(width=600, height=600):
+    # Plain white PNG used instead of the spider chart with --no-chart, so
+    # the run does not need a browser for kaleido
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    raw = b"".join(b"\x00" + b"\xff" * width * 3 for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+
+def run_company(trace, client, summary_client, survey, company, args, cache, chart_png):
+    # One company through the same stages as the app and the batch CLI
+    with trace.stage("company"):
+        company_df = survey.company_frame(company)
+        with trace.stage("ratings", cache=cache, rows=len(company_df)) as stage:
+            company_df["Bewertung (1-5)"] = rate_rows(
+                stage.wrap(client), company_df, concurrency=args.concurrency, batch_size=args.batch_size,
+                base_delay=args.base_delay, cache=cache, on_retry=stage.record_retry)
+        company_df = normalize_ratings(company_df)
+        with trace.stage("summary", cache=cache) as stage:
+            summary = generate_executive_summary(stage.wrap(summary_client), company_df, cache=cache, stage=stage)
+        with trace.stage("chart_render"):
+            png = chart_png if chart_png is not None else get_chart_png(company_df)
+        with trace.stage("docx_assembly", rows=len(company_df)) as stage:
+            build_document(png, company_df, summary, str(company), args.template, stage)
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=float)
+    return {
+        "n": int(values.size),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "max": float(values.max()),
+    }
+
+
+def run_benchmark(args, base_url):
+    data = make_survey_workbook(args.companies, args.questions, args.categories, args.answer_words, args.seed)
+    print(f"Workbook: {args.companies} companies x {args.questions} questions, {len(data) / 1024:.0f} KiB")
+
+    client = make_client("stub", base_url)
+    summary_client = client.with_options(max_retries=SUMMARY_MAX_RETRIES)
+    scheduler = None
+    if args.rpm or args.tpm:
+        scheduler = ApiScheduler(args.rpm or 10 ** 9, args.tpm or 10 ** 12, args.max_in_flight)
+    chart_png = blank_png() if args.no_chart else None
+
+    cache = None
+    cache_dir = None
+    if args.cache:
+        cache_dir = tempfile.TemporaryDirectory()
+        cache = LLMCache(f"{cache_dir.name}/bench_cache.sqlite")
+
+    traces = []
+    started = time.perf_counter()
+    ingest = Trace("workbook")
+    traces.append(ingest)
+    with ingest.stage("excel_ingest", bytes=len(data)):
+        survey = read_survey_workbook(data)
+
+    # Companies run side by side like sessions of concurrent users
+    def process(company):
+        trace = Trace(company)
+        traces.append(trace)
+        # Every company is a session of its own for the scheduler
+        if scheduler is not None:
+            run_company(trace, scheduler.wrap(client, company), scheduler.wrap(summary_client, company),
+                        survey, company, args, cache, chart_png)
+        else:
+            run_company(trace, client, summary_client, survey, company, args, cache, chart_png)
+    with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+        list(executor.map(process, survey.companies))
+    elapsed = time.perf_counter() - started
+
+    if cache_dir is not None:
+        cache_dir.cleanup()
+
+    records = [record for trace in traces for record in trace.records()]
+    results = {
+        "companies": len(survey.companies),
+        "seconds": elapsed,
+        "companies_per_minute": len(survey.companies) / elapsed * 60,
+        "api_calls": sum(record["api_calls"] for record in records),
+        "retries": sum(record["retries"] for record in records),
+        "prompt_tokens": sum(record["prompt_tokens"] for record in records),
+        "completion_tokens": sum(record["completion_tokens"] for record in records),
+        "stages": {},
+    }
+    results["api_calls_per_second"] = results["api_calls"] / elapsed
+    if scheduler is not None:
+        results["scheduler"] = scheduler.stats()
+    for name in STAGES:
+        seconds = [record["seconds"] for record in records if record["stage"] == name]
+        if seconds:
+            results["stages"][name] = percentiles(seconds)
+    return results
+
+
+def print_results(results):
+    print(f"{'stage':<15}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, stats in results["stages"].items():
+        print(f"{name:<15}{stats['n']:>6}{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}"
+              f"{stats['max'] * 1000:>10.1f}")
+    print(
+        f"{results['companies']} companies in {results['seconds']:.1f}s: "
+        f"{results['companies_per_minute']:.1f} companies/min, "
+        f"{results['api_calls']} API calls ({results['api_calls_per_second']:.1f}/s, "
+        f"{results['retries']} retries), "
+        f"{results['prompt_tokens']} prompt + {results['completion_tokens']} completion tokens"
+    )
+    if "scheduler" in results:
+        stats = results["scheduler"]
+        print(f"Scheduler queue wait: p50 {stats['interactive_wait_p50'] * 1000:.1f} ms, "
+              f"p95 {stats['interactive_wait_p95'] * 1000:.1f} ms, max {stats['interactive_wait_max'] * 1000:.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="End-to-end benchmark of ingestion, rating, summary and document generation "
+                    "on a synthetic workbook against a local OpenAI stub.")
+    parser.add_argument("--companies", type=int, default=20, help="Companies in the synthetic workbook")
+    parser.add_argument("--questions", type=int, default=60, help="Questions per company")
+    parser.add_argument("--categories", type=int, default=8, help="Number of categories")
+    parser.add_argument("--answer-words", type=int, default=40, help="Average words per answer")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the workbook")
+    parser.add_argument("--parallel", type=int, default=1, help="Companies processed at the same time")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Parallel rating requests per company")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Questions per rating request")
+    parser.add_argument("--base-delay", type=float, default=0.05, help="Base retry delay of the rating engine")
+    parser.add_argument("--cache", action="store_true", help="Use a fresh LLM cache for the run")
+    parser.add_argument("--template", default=TEMPLATE_PATH, help="Word template")
+    parser.add_argument("--no-chart", action="store_true", help="Use a blank PNG instead of rendering with kaleido")
+    parser.add_argument("--rpm", type=int, help="Limit requests per minute with the API scheduler")
+    parser.add_argument("--tpm", type=int, help="Limit tokens per minute with the API scheduler")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="Scheduler limit on requests in flight")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Stub random extra seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of stub requests failing with 429")
+    parser.add_argument("--base-url", help="Use this OpenAI-compatible server instead of starting the stub")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.base_url:
+        results = run_benchmark(args, args.base_url)
+    else:
+        with StubOpenAI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        rate_limit_rate=args.rate_limit_rate, seed=args.seed) as stub:
+            results = run_benchmark(args, stub.url)
+            results["stub"] = stub.stats()
+        print(f"Stub: {results['stub']['requests']} requests, {results['stub']['errors']} errors injected, "
+              f"at most {results['stub']['max_in_flight']} in flight")
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
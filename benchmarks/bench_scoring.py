@@ -0,0 +1,82 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from scoring import ScoreTable
+
+
+def make_frames(companies, questions, categories, seed=0):
+    rng = np.random.default_rng(seed)
+    kategorien = [f"Kategorie {index * categories // questions + 1}" for index in range(questions)]
+    fragen = [f"Frage {index + 1}" for index in range(questions)]
+    return {
+        f"Firma {number:05d}": pd.DataFrame({
+            "Kategorie": kategorien,
+            "Frage": fragen,
+            "Bewertung (1-5)": rng.integers(1, 6, questions),
+        })
+        for number in range(companies)
+    }
+
+
+def groupby_profile(frames, company):
+    # Baseline: one groupby per company frame, as create_spider_chart does
+    means = pd.DataFrame({name: df.groupby("Kategorie", sort=False)["Bewertung (1-5)"].mean()
+                          for name, df in frames.items()}).T
+    return means.loc[company], means.drop(company).mean(), means.rank(pct=True).loc[company]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark peer comparisons over many rated companies.")
+    parser.add_argument("--companies", type=int, default=2000, help="Rated companies")
+    parser.add_argument("--questions", type=int, default=60, help="Questions per company")
+    parser.add_argument("--categories", type=int, default=8, help="Number of categories")
+    args = parser.parse_args(argv)
+
+    frames = make_frames(args.companies, args.questions, args.categories)
+    company = next(iter(frames))
+
+    started = time.perf_counter()
+    score_table = ScoreTable()
+    for name, df in frames.items():
+        score_table.set_company(name, df)
+    added = time.perf_counter() - started
+
+    started = time.perf_counter()
+    score_table.table()
+    built = time.perf_counter() - started
+
+    started = time.perf_counter()
+    profile = score_table.company_profile(company)
+    first = time.perf_counter() - started
+
+    # An analyst confirming edits of one company invalidates the aggregates
+    edited = frames[company].assign(**{"Bewertung (1-5)": 5})
+    started = time.perf_counter()
+    score_table.set_company(company, edited)
+    score_table.company_profile(company)
+    update = time.perf_counter() - started
+
+    started = time.perf_counter()
+    score_table.company_profile(company)
+    cached = time.perf_counter() - started
+
+    started = time.perf_counter()
+    groupby_profile(frames, company)
+    baseline = time.perf_counter() - started
+
+    rows = args.companies * args.questions
+    print(f"{args.companies} companies, {rows} ratings")
+    print(f"add companies:              {added * 1000:.1f} ms")
+    print(f"build long table:           {built * 1000:.1f} ms")
+    print(f"aggregate + profile:        {first * 1000:.1f} ms")
+    print(f"profile after one edit:     {update * 1000:.1f} ms")
+    print(f"profile, unchanged table:   {cached * 1000:.3f} ms")
+    print(f"groupby per company frame:  {baseline * 1000:.1f} ms")
+    print(profile.round(2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import pandas as pd
+from docx import Document
+
+from docx_stream import StreamingTemplate
+from template_engine import CompiledTemplate, fill_document, report_replacements
+
+COLUMNS = ["Kategorie", "Frage", "Antwort", "Bewertung (1-5)"]
+
+
+def make_template(rows, columns=len(COLUMNS)):
+    # Template in the layout of template.docx: a table of {{cXrY}}
+    # placeholders with header row 0 plus a few free-text placeholders
+    document = Document()
+    document.add_paragraph("Bericht für {{Company_Name}}")
+    table = document.add_table(rows=rows + 1, cols=columns)
+    for row_index, row in enumerate(table.rows):
+        for col_index, cell in enumerate(row.cells):
+            cell.text = f"{{{{c{col_index}r{row_index}}}}}"
+    document.add_paragraph("Executive Summary")
+    document.add_paragraph("{{Executive_Summary}}")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_frame(rows):
+    return pd.DataFrame({
+        "Kategorie": [f"Kategorie {i % 8}" for i in range(rows)],
+        "Frage": [f"Frage {i}" for i in range(rows)],
+        "Antwort": [f"Antwort auf Frage {i} " * 5 for i in range(rows)],
+        "Bewertung (1-5)": [i % 5 + 1 for i in range(rows)],
+    })
+
+
+def legacy_fill(template, df, executive_summary, company_name):
+    # The nested row x column loops generate_document used before the
+    # single-pass engine, kept here as the baseline
+    for paragraph in template.paragraphs:
+        if "{{Executive_Summary}}" in paragraph.text:
+            paragraph.text = paragraph.text.replace("{{Executive_Summary}}", executive_summary)
+        if "{{Company_Name}}" in paragraph.text:
+            paragraph.text = paragraph.text.replace("{{Company_Name}}", company_name)
+
+    for paragraph in template.paragraphs:
+        for row_index in range(len(df) + 1):
+            for col_index in range(len(df.columns)):
+                placeholder = f"{{{{c{col_index}r{row_index}}}}}"
+                if placeholder in paragraph.text:
+                    if row_index == 0:
+                        replacement = str(df.columns[col_index])
+                    else:
+                        replacement = str(df.iloc[row_index - 1, col_index])
+                    paragraph.text = paragraph.text.replace(placeholder, replacement)
+
+    for table in template.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for row_index in range(len(df) + 1):
+                    for col_index in range(len(df.columns)):
+                        placeholder = f"{{{{c{col_index}r{row_index}}}}}"
+                        if placeholder in cell.text:
+                            if row_index == 0:
+                                replacement = str(df.columns[col_index])
+                            else:
+                                replacement = str(df.iloc[row_index - 1, col_index])
+                            cell.text = cell.text.replace(placeholder, replacement)
+
+
+def single_pass_fill(template, df, executive_summary, company_name):
+    fill_document(template, report_replacements(df, executive_summary, company_name))
+
+
+def time_fill(fill, template_bytes, df, repeat):
+    # Best of repeat runs, excluding template parsing
+    best = None
+    for _ in range(repeat):
+        template = Document(io.BytesIO(template_bytes))
+        started = time.perf_counter()
+        fill(template, df, "Zusammenfassung", "Beispiel AG")
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, template
+
+
+def time_per_report(template_bytes, df, repeat):
+    # Parse + fill per report, versus rendering from a compiled template,
+    # versus writing at zip level; all three including saving the .docx
+    values = report_replacements(df, "Zusammenfassung", "Beispiel AG")
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        document = Document(io.BytesIO(template_bytes))
+        fill_document(document, values)
+        document.save(io.BytesIO())
+    parsed = (time.perf_counter() - started) / repeat
+
+    with tempfile.NamedTemporaryFile(suffix=".docx", delete=False) as f:
+        f.write(template_bytes)
+    try:
+        compiled_template = CompiledTemplate(f.name)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            compiled_template.render(values).save(io.BytesIO())
+        compiled = (time.perf_counter() - started) / repeat
+
+        streaming_template = StreamingTemplate(f.name)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            streaming_template.write(io.BytesIO(), values)
+        streamed = (time.perf_counter() - started) / repeat
+    finally:
+        os.unlink(f.name)
+    return parsed, compiled, streamed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark placeholder substitution on a large template.")
+    parser.add_argument("--rows", type=int, default=500, help="Data rows in the template table")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the single-pass engine")
+    parser.add_argument("--template", help="Time per-report rendering of this .docx instead of the generated template")
+    parser.add_argument("--legacy-repeat", type=int, default=1, help="Runs of the legacy loops (0 to skip)")
+    args = parser.parse_args(argv)
+
+    template_bytes = make_template(args.rows)
+    df = make_frame(args.rows)
+
+    fast, filled = time_fill(single_pass_fill, template_bytes, df, args.repeat)
+    print(f"single pass: {fast * 1000:.1f} ms for {args.rows} rows")
+
+    if args.template:
+        with open(args.template, "rb") as f:
+            parsed, compiled, streamed = time_per_report(f.read(), df, args.repeat)
+    else:
+        parsed, compiled, streamed = time_per_report(template_bytes, df, args.repeat)
+    print(f"per report, parse + fill:       {parsed * 1000:.1f} ms")
+    print(f"per report, compiled template:  {compiled * 1000:.1f} ms")
+    print(f"per report, zip-level stream:   {streamed * 1000:.1f} ms")
+
+    if args.legacy_repeat:
+        slow, legacy = time_fill(legacy_fill, template_bytes, df, args.legacy_repeat)
+        print(f"legacy:      {slow * 1000:.1f} ms for {args.rows} rows")
+        print(f"speedup:     {slow / fast:.0f}x")
+        same = [c.text for c in filled.tables[0]._cells] == [c.text for c in legacy.tables[0]._cells]
+        print(f"identical table output: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import http.server
+import json
+import random
+import re
+import threading
+import time
+
+# IDs of the questions in a batch rating prompt
+_BATCH_ID_RE = re.compile(r"^ID: (\d+)$", re.MULTILINE)
+
+# Words the stub's executive summaries are made of
+_SUMMARY_WORDS = (
+    "Die Firma zeigt in den meisten Kategorien solide Ergebnisse mit einzelnen "
+    "Schwächen bei Prozessen und Dokumentation sowie klarem Potenzial für Verbesserungen"
+).split()
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    # Bursts of parallel rating requests overflow the default listen backlog
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class StubOpenAI:
+    # Local OpenAI-compatible server for /v1/chat/completions. Answers rating
+    # prompts (single and batch) with random ratings and summary prompts with
+    # filler text, optionally streamed. Every request waits latency seconds
+    # (plus up to jitter); error_rate of them fail with a 500 and
+    # rate_limit_rate with a 429.
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.1, error_rate=0.0,
+                 rate_limit_rate=0.0, summary_words=250, stream_delay=0.005, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.summary_words = summary_words
+        self.stream_delay = stream_delay
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="openai-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "max_in_flight": self.max_in_flight}
+
+    def _draw(self):
+        # Delay and outcome of one request
+        with self._lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            roll = self.random.random()
+            rating = self.random.randint(1, 5)
+        if roll < self.error_rate:
+            return delay, 500, rating
+        if roll < self.error_rate + self.rate_limit_rate:
+            return delay, 429, rating
+        return delay, 200, rating
+
+    def _content(self, body, rating):
+        prompt = body["messages"][-1]["content"]
+        if "Executive Summary" in prompt:
+            with self._lock:
+                words = [self.random.choice(_SUMMARY_WORDS) for _ in range(self.summary_words)]
+            return " ".join(words) + "."
+        if body.get("response_format", {}).get("type") == "json_object":
+            with self._lock:
+                ratings = [{"id": int(row_id), "rating": self.random.randint(1, 5)}
+                           for row_id in _BATCH_ID_RE.findall(prompt)]
+            return json.dumps({"ratings": ratings})
+        return str(rating)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                delay, status, rating = stub._draw()
+                with stub._lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    time.sleep(delay)
+                    if status != 200:
+                        with stub._lock:
+                            stub.errors += 1
+                        self._send_error(status)
+                    elif body.get("stream"):
+                        self._send_stream(body, stub._content(body, rating))
+                    else:
+                        self._send_completion(body, stub._content(body, rating))
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def _usage(self, body, content):
+                # Rough token counts, enough for cost accounting in traces
+                prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+                completion_tokens = max(1, len(content) // 4)
+                return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens}
+
+            def _send_json(self, status, payload, headers=()):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_error(self, status):
+                kind = "rate_limit_exceeded" if status == 429 else "server_error"
+                headers = [("Retry-After", "0")] if status == 429 else []
+                self._send_json(status, {"error": {"message": f"stub {kind}", "type": kind, "code": kind}}, headers)
+
+            def _send_completion(self, body, content):
+                self._send_json(200, {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": self._usage(body, content),
+                })
+
+            def _send_stream(self, body, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send(payload):
+                    data = f"data: {payload}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+                def chunk(choices, usage=None):
+                    return json.dumps({"id": "chatcmpl-stub", "object": "chat.completion.chunk",
+                                       "created": int(time.time()), "model": body["model"],
+                                       "choices": choices, "usage": usage})
+
+                for word in content.split(" "):
+                    send(chunk([{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]))
+                    if stub.stream_delay:
+                        time.sleep(stub.stream_delay)
+                send(chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    send(chunk([], self._usage(body, content)))
+                send("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds every request takes")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random extra seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests failing with 429")
+    parser.add_argument("--summary-words", type=int, default=250, help="Length of generated summaries")
+    args = parser.parse_args(argv)
+
+    stub = StubOpenAI(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                      args.rate_limit_rate, args.summary_words)
+    print(f"OpenAI stub listening on {stub.url} (set openai_base_url / OPENAI_BASE_URL to this)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import io
+import random
+
+from openpyxl import Workbook
+
+from excel_ingest import SHEET_NAME
+from report_core import COMPANY_COLUMN, FIRST_QUESTION_COLUMN
+
+# Words the synthetic answers are made of
+WORDS = (
+    "Prozess Kunde Qualität Strategie Mitarbeitende Digitalisierung Daten Sicherheit "
+    "Innovation Nachhaltigkeit Budget Projekt Führung Kommunikation Risiko Markt "
+    "Entwicklung Verantwortung Ziel Massnahme Schulung Lieferant Kosten Wachstum"
+).split()
+
+# Share of answers left empty, like skipped questions in a real survey
+EMPTY_ANSWER_SHARE = 0.05
+
+
+def question_headers(questions, categories):
+    # "Kategorie - Frage" headers as split_header expects them, the
+    # questions spread evenly over the categories
+    per_category = -(-questions // categories)
+    return [
+        f"Kategorie {index // per_category + 1} - Frage {index + 1}: Wie gut ist Bereich {index + 1} aufgestellt?"
+        for index in range(questions)
+    ]
+
+
+def make_answer(rng, words):
+    if rng.random() < EMPTY_ANSWER_SHARE:
+        return None
+    length = max(1, int(rng.gauss(words, words / 3)))
+    return " ".join(rng.choice(WORDS) for _ in range(length)) + "."
+
+
+def make_survey_workbook(companies=20, questions=60, categories=8, answer_words=40, seed=0):
+    # xlsx bytes in the layout of the real survey export: metadata columns,
+    # company names in column F, questions from column H onwards, one row
+    # per company
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(SHEET_NAME)
+
+    header = [f"Feld {index + 1}" for index in range(FIRST_QUESTION_COLUMN)]
+    header[COMPANY_COLUMN] = "Firma"
+    sheet.append(header + question_headers(questions, categories))
+
+    for number in range(1, companies + 1):
+        row = [None] * FIRST_QUESTION_COLUMN
+        row[0] = number
+        row[COMPANY_COLUMN] = f"Firma {number:04d} AG"
+        row.extend(make_answer(rng, answer_words) for _ in range(questions))
+        sheet.append(row)
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic survey workbook.")
+    parser.add_argument("output", help="Target .xlsx file")
+    parser.add_argument("--companies", type=int, default=20, help="Number of companies (rows)")
+    parser.add_argument("--questions", type=int, default=60, help="Number of questions (columns)")
+    parser.add_argument("--categories", type=int, default=8, help="Number of categories")
+    parser.add_argument("--answer-words", type=int, default=40, help="Average words per answer")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args(argv)
+
+    data = make_survey_workbook(args.companies, args.questions, args.categories, args.answer_words, args.seed)
+    with open(args.output, "wb") as f:
+        f.write(data)
+    print(f"Wrote {args.companies} companies x {args.questions} questions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from report_core import category_averages, spider_chart_from_averages
+
+# Resolution factor of the PNG embedded in the Word document
+CHART_SCALE = 2
+
+# Rendered charts kept in memory
+MAX_CACHED_CHARTS = 64
+
+# Seconds to wait for a chart before giving up on its render
+CHART_TIMEOUT = 60
+
+# One export at a time, kaleido is kept warm between calls. Renders run on
+# daemon threads, so an export that never returns cannot block the exit.
+_render_lock = threading.Lock()
+_charts = OrderedDict()  # chart key -> Future with the PNG bytes
+_render_seconds = {}  # chart key -> seconds kaleido took to render it
+_lock = threading.Lock()
+_renderer_started = False
+
+
+def chart_key(averages):
+    # Identical per-category averages give an identical chart
+    raw = json.dumps([[str(kategorie), round(float(mean), 6)] for kategorie, mean in averages.items()],
+                     ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _start_renderer():
+    # Kaleido 1.x can keep one headless browser running for all exports;
+    # older versions keep their renderer process alive on their own. Only
+    # started after an export has worked: the server fails in its own thread,
+    # e.g. without Chrome, and exports waiting for it would hang.
+    global _renderer_started
+    if _renderer_started:
+        return
+    _renderer_started = True
+    try:
+        import kaleido
+        if hasattr(kaleido, "start_sync_server"):
+            kaleido.start_sync_server(silence_warnings=True)
+    except Exception as e:
+        print(f"Could not start persistent chart renderer: {e}")
+
+
+def _stop_renderer():
+    # Runs on a daemon thread: stopping a server stuck in an export blocks
+    global _renderer_started
+    _renderer_started = False
+    try:
+        import kaleido
+        if hasattr(kaleido, "stop_sync_server"):
+            threading.Thread(target=kaleido.stop_sync_server, kwargs={"silence_warnings": True},
+                             name="chart-render-stop", daemon=True).start()
+    except Exception as e:
+        print(f"Could not stop persistent chart renderer: {e}")
+
+
+def _render(key, averages):
+    started = time.perf_counter()
+    fig = spider_chart_from_averages(averages)
+    png = fig.to_image(format="png", scale=CHART_SCALE)
+    _render_seconds[key] = time.perf_counter() - started
+    _start_renderer()
+    return png
+
+
+def _run(future, key, averages, render_lock):
+    with render_lock:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(_render(key, averages))
+        except BaseException as e:
+            future.set_exception(e)
+
+
+def _submit(key, averages):
+    future = Future()
+    threading.Thread(target=_run, args=(future, key, averages, _render_lock),
+                     name="chart-render", daemon=True).start()
+    return future
+
+
+def render_chart_async(df):
+    # Start rendering the spider chart PNG of df in the background and
+    # return a Future with the bytes. Charts with the same averages are only
+    # rendered once; failed renders are retried on the next request.
+    averages = category_averages(df)
+    key = chart_key(averages)
+    with _lock:
+        future = _charts.get(key)
+        if future is not None and not (future.done() and future.exception() is not None):
+            _charts.move_to_end(key)
+            return future
+        future = _submit(key, averages)
+        _charts[key] = future
+        while len(_charts) > MAX_CACHED_CHARTS:
+            evicted, _ = _charts.popitem(last=False)
+            _render_seconds.pop(evicted, None)
+        return future
+
+
+def wait_chart(future, timeout=CHART_TIMEOUT):
+    # PNG bytes of a render_chart_async future. A render that takes longer
+    # than timeout is dropped from the cache together with the persistent
+    # renderer, and later renders no longer queue behind it.
+    global _render_lock
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        with _lock:
+            for key, cached in list(_charts.items()):
+                if cached is future:
+                    del _charts[key]
+                    _render_seconds.pop(key, None)
+            _render_lock = threading.Lock()
+        _stop_renderer()
+        raise RuntimeError(f"Chart rendering did not finish within {timeout:.0f}s") from None
+
+
+def get_chart_png(df, timeout=CHART_TIMEOUT):
+    return wait_chart(render_chart_async(df), timeout)
+
+
+def render_seconds(df):
+    # Time the last render of df's chart took, None if not rendered (yet)
+    return _render_seconds.get(chart_key(category_averages(df)))
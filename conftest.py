@@ -0,0 +1 @@
+# Makes the flat top-level modules importable from tests/ with plain pytest
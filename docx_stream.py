@@ -0,0 +1,297 @@
+import io
+import os
+import re
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+from docx.oxml.ns import qn
+from docx.text.run import Run
+
+from template_engine import (
+    DEFAULT_IMAGE_WIDTH,
+    PLACEHOLDER_RE,
+    get_compiled_template,
+    fill_document,
+    iter_stories,
+)
+
+# Deflate level for the parts that change with every report
+DOCX_COMPRESSLEVEL = 6
+
+# Marks placeholders in the serialised XML; private use characters never
+# occur in the template text
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+_MARK_RE = re.compile(f"{_MARK_START}(\\w+){_MARK_END}")
+
+# Characters XML 1.0 does not allow, e.g. vertical tabs from Excel cells
+_INVALID_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+# Line breaks and tabs inside a replacement, as python-docx writes them
+_BREAK_RE = re.compile("[\r\n\t]")
+_BREAKS = {
+    "\r": '</w:t><w:br/><w:t xml:space="preserve">',
+    "\n": '</w:t><w:br/><w:t xml:space="preserve">',
+    "\t": '</w:t><w:tab/><w:t xml:space="preserve">',
+}
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+_REL_TYPE_IMAGE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+_DRAWING_XML = (
+    '</w:t><w:drawing>'
+    '<wp:inline distT="0" distB="0" distL="0" distR="0" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing">'
+    '<wp:extent cx="{cx}" cy="{cy}"/>'
+    '<wp:docPr id="{id}" name="Picture {id}"/>'
+    '<wp:cNvGraphicFramePr>'
+    '<a:graphicFrameLocks xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" noChangeAspect="1"/>'
+    '</wp:cNvGraphicFramePr>'
+    '<a:graphic xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">'
+    '<a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    '<pic:pic xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    '<pic:nvPicPr><pic:cNvPr id="0" name="{filename}"/><pic:cNvPicPr/></pic:nvPicPr>'
+    '<pic:blipFill>'
+    '<a:blip xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" r:embed="{rid}"/>'
+    '<a:stretch><a:fillRect/></a:stretch>'
+    '</pic:blipFill>'
+    '<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr>'
+    '</pic:pic></a:graphicData></a:graphic></wp:inline>'
+    '</w:drawing><w:t xml:space="preserve">'
+)
+
+
+def _dos_time(date_time):
+    year, month, day, hour, minute, second = date_time[:6]
+    return ((hour << 11) | (minute << 5) | (second // 2),
+            ((max(year, 1980) - 1980) << 9) | (month << 5) | day)
+
+
+class _ZipEntry:
+    # A zip member compressed once, ready to be written any number of times
+    def __init__(self, name, data, compress_type, date_time, compresslevel=DOCX_COMPRESSLEVEL):
+        self.name = name.encode("utf-8")
+        self.size = len(data)
+        self.crc = zlib.crc32(data)
+        self.date_time = date_time
+        if compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+            self.data = compressor.compress(data) + compressor.flush()
+            self.method = zipfile.ZIP_DEFLATED
+        else:
+            self.data = data
+            self.method = zipfile.ZIP_STORED
+
+
+class _ZipWriter:
+    # Minimal sequential zip writer: members are written as they come and
+    # the central directory at the end, so the output may be any writable
+    # stream, including a member of another zip file being written
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._offset = 0
+        self._directory = []
+
+    def _write(self, data):
+        self._fileobj.write(data)
+        self._offset += len(data)
+
+    def add(self, entry):
+        dos_time, dos_date = _dos_time(entry.date_time)
+        flags = 0x800 if not entry.name.isascii() else 0
+        self._directory.append((entry, self._offset, flags, dos_time, dos_date))
+        self._write(struct.pack(
+            "<4s5H3L2H", b"PK\x03\x04", 20, flags, entry.method, dos_time, dos_date,
+            entry.crc, len(entry.data), entry.size, len(entry.name), 0,
+        ) + entry.name)
+        self._write(entry.data)
+
+    def close(self):
+        start = self._offset
+        for entry, offset, flags, dos_time, dos_date in self._directory:
+            self._write(struct.pack(
+                "<4s6H3L5H2L", b"PK\x01\x02", 20, 20, flags, entry.method, dos_time, dos_date,
+                entry.crc, len(entry.data), entry.size, len(entry.name), 0, 0, 0, 0, 0, offset,
+            ) + entry.name)
+        self._write(struct.pack(
+            "<4s4H2LH", b"PK\x05\x06", 0, 0, len(self._directory), len(self._directory),
+            self._offset - start, start, 0,
+        ))
+
+
+def _png_size(data):
+    if data[:8] != _PNG_SIGNATURE:
+        raise ValueError("Only PNG images can be inserted by the streaming writer")
+    return struct.unpack(">II", data[16:24])
+
+
+def _read_image(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "read"):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return source.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def text_xml(value):
+    # Replacement text as the content of a w:t element
+    text = escape(_INVALID_XML_RE.sub("", str(value)))
+    return _BREAK_RE.sub(lambda m: _BREAKS[m.group(0)], text)
+
+
+class StreamingTemplate:
+    # A Word template prepared for writing reports at zip level. All parts
+    # without placeholders (styles, theme, media, ...) are compressed once and
+    # copied into every report as they are; the parts with placeholders are
+    # kept as their serialised XML split at the placeholders, so a report
+    # only joins strings and deflates those parts. Image placeholders in the
+    # main document become an inline picture with its own media part.
+
+    def __init__(self, path, compresslevel=DOCX_COMPRESSLEVEL):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.compresslevel = compresslevel
+
+        # partname -> [literal XML, placeholder name, literal XML, ...]
+        self.parts = self._split_parts(get_compiled_template(path))
+
+        with zipfile.ZipFile(path) as archive:
+            self._infos = archive.infolist()
+            data = {info.filename: archive.read(info) for info in self._infos}
+        self._names = set(data)
+        self._rels = data.get("word/_rels/document.xml.rels", b"").decode("utf-8")
+        self._content_types = data["[Content_Types].xml"].decode("utf-8")
+        self._entries = {
+            info.filename: _ZipEntry(info.filename, data[info.filename], info.compress_type, info.date_time,
+                                     compresslevel)
+            for info in self._infos if info.filename not in self.parts
+        }
+
+        # Drawing ids must be unique within the document
+        document = "".join(self.parts.get("word/document.xml", [])[0::2])
+        self._picture_ids = max((int(value) for value in re.findall(r'<wp:docPr [^>]*\bid="(\d+)"', document)),
+                                default=0)
+
+    @staticmethod
+    def _split_parts(compiled):
+        # Serialise every part holding placeholders once, each placeholder
+        # moved into a single w:t element and marked
+        document = compiled.new_document()
+        fill_document(document, {name: f"{{{{{name}}}}}" for name in compiled.placeholders})
+        parts = {}
+        for story in iter_stories(document):
+            marked = False
+            for r in story._element.iter(qn("w:r")):
+                run = Run(r, story)
+                text = run.text
+                if "{{" not in text:
+                    continue
+                # A placeholder split over several w:t of one run
+                complete = sum(len(PLACEHOLDER_RE.findall(t.text or "")) for t in r.iter(qn("w:t")))
+                if complete != len(PLACEHOLDER_RE.findall(text)):
+                    run.text = text
+                for t in r.iter(qn("w:t")):
+                    if t.text and PLACEHOLDER_RE.search(t.text):
+                        t.text = PLACEHOLDER_RE.sub(lambda m: f"{_MARK_START}{m.group(1)}{_MARK_END}", t.text)
+                        t.set(qn("xml:space"), "preserve")
+                        marked = True
+            if marked:
+                part = story.part
+                parts[part.partname.lstrip("/")] = _MARK_RE.split(part.blob.decode("utf-8"))
+        return parts
+
+    @property
+    def placeholders(self):
+        return {name for segments in self.parts.values() for name in segments[1::2]}
+
+    def is_stale(self):
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return True
+
+    def _pictures(self, images):
+        # Inline drawing XML per image placeholder of the main document, plus
+        # the media entries and relationships they need
+        names = set(self.parts.get("word/document.xml", [])[1::2])
+        pictures, media, relationships = {}, [], []
+        for number, (name, image) in enumerate(sorted((images or {}).items()), 1):
+            if name not in names:
+                continue
+            source, width = image if isinstance(image, tuple) else (image, DEFAULT_IMAGE_WIDTH)
+            data = _read_image(source)
+            pixels_wide, pixels_high = _png_size(data)
+            filename = f"report_image{number}.png"
+            while f"word/media/{filename}" in self._names:
+                filename = f"_{filename}"
+            rid = f"rIdReport{number}"
+            cx = int(width)
+            pictures[name] = _DRAWING_XML.format(cx=cx, cy=int(cx * pixels_high / pixels_wide),
+                                                 id=self._picture_ids + number, filename=filename, rid=rid)
+            media.append((f"word/media/{filename}", data))
+            relationships.append(f'<Relationship Id="{rid}" Type="{_REL_TYPE_IMAGE}" Target="media/{filename}"/>')
+        return pictures, media, relationships
+
+    def write(self, fileobj, values, images=None):
+        # Write the report as a .docx into fileobj; values maps placeholder
+        # names to text, images names to PNG bytes, file-likes or paths
+        # (optionally as a (source, width) tuple)
+        pictures, media, relationships = self._pictures(images)
+        now = time.localtime()[:6]
+        writer = _ZipWriter(fileobj)
+        for info in self._infos:
+            name = info.filename
+            if name in self.parts:
+                segments = self.parts[name]
+                xml = "".join(
+                    segment if index % 2 == 0
+                    else text_xml(values[segment]) if segment in values
+                    else pictures[segment] if segment in pictures
+                    else f"{{{{{segment}}}}}"
+                    for index, segment in enumerate(segments)
+                )
+                entry = _ZipEntry(name, xml.encode("utf-8"), info.compress_type, now, self.compresslevel)
+            elif name == "word/_rels/document.xml.rels" and relationships:
+                rels = self._rels.replace("</Relationships>", "".join(relationships) + "</Relationships>")
+                entry = _ZipEntry(name, rels.encode("utf-8"), info.compress_type, now, self.compresslevel)
+            elif name == "[Content_Types].xml" and media and 'Extension="png"' not in self._content_types:
+                types = self._content_types.replace(
+                    "<Default ", '<Default Extension="png" ContentType="image/png"/><Default ', 1)
+                entry = _ZipEntry(name, types.encode("utf-8"), info.compress_type, now, self.compresslevel)
+            else:
+                entry = self._entries[name]
+            writer.add(entry)
+        for name, data in media:
+            # Already compressed, deflating again gains nothing
+            writer.add(_ZipEntry(name, data, zipfile.ZIP_STORED, now))
+        writer.close()
+
+    def render(self, values, images=None):
+        buffer = io.BytesIO()
+        self.write(buffer, values, images)
+        return buffer.getvalue()
+
+
+# Process-wide cache of streaming templates, keyed by absolute path
+_streaming_templates = {}
+_streaming_templates_lock = threading.Lock()
+
+
+def get_streaming_template(path):
+    # Streaming template for path, prepared again when the file's mtime changes
+    key = os.path.abspath(path)
+    with _streaming_templates_lock:
+        template = _streaming_templates.get(key)
+        if template is None or template.is_stale():
+            template = StreamingTemplate(path)
+            _streaming_templates[key] = template
+        return template
@@ -0,0 +1,107 @@
+import hashlib
+import io
+import math
+
+from report_core import COMPANY_COLUMN, FIRST_QUESTION_COLUMN, frame_from_answers
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # openpyxl in read-only mode is used instead
+    CalamineWorkbook = None
+
+SHEET_NAME = "Sheet1"
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _iter_rows_calamine(data, sheet_name):
+    workbook = CalamineWorkbook.from_filelike(io.BytesIO(data))
+    yield from workbook.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False)
+
+
+def _iter_rows_openpyxl(data, sheet_name):
+    from openpyxl import load_workbook
+
+    # Read-only mode streams the rows instead of building the whole sheet
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name]
+        # Read-only mode trusts the stored <dimension>, which may be wrong;
+        # pandas.read_excel resets it as well
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _column_names(header):
+    # Header names as pandas.read_excel would produce them: unnamed columns
+    # become "Unnamed: N" and repeated names get a ".1", ".2", ... suffix
+    names = []
+    seen = {}
+    for position, value in enumerate(header):
+        if value is None or value == "":
+            name = f"Unnamed: {position}"
+        else:
+            name = str(value) if not isinstance(value, str) else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _cell(value):
+    # Empty cells as NaN, like pandas
+    return math.nan if value is None or value == "" else value
+
+
+class SurveyWorkbook:
+    # Parsed survey workbook reduced to what the reports use: the question
+    # headers from column H onwards and, per company of column F, the answers
+    # of its first row. Looking up a company is a dict access.
+
+    def __init__(self, headers, answers_by_company):
+        self.headers = headers
+        self.answers_by_company = answers_by_company
+
+    @property
+    def companies(self):
+        return list(self.answers_by_company)
+
+    @property
+    def empty(self):
+        # Nothing to report on without companies or question columns
+        return not self.answers_by_company or not self.headers
+
+    def company_frame(self, company):
+        return frame_from_answers(self.headers, self.answers_by_company[company])
+
+
+def read_survey_workbook(data, sheet_name=SHEET_NAME):
+    # Single pass over the sheet, with python-calamine if installed
+    rows = _iter_rows_calamine(data, sheet_name) if CalamineWorkbook is not None else _iter_rows_openpyxl(data, sheet_name)
+
+    header = list(next(rows, ()))
+    # Drop trailing columns without a header
+    while header and (header[-1] is None or header[-1] == ""):
+        header.pop()
+    width = len(header)
+    headers = _column_names(header)[FIRST_QUESTION_COLUMN:]
+
+    answers_by_company = {}
+    for row in rows:
+        if len(row) <= COMPANY_COLUMN:
+            continue
+        company = row[COMPANY_COLUMN]
+        if company is None or company == "" or company in answers_by_company:
+            continue
+        answers = [_cell(value) for value in row[FIRST_QUESTION_COLUMN:width]]
+        answers.extend([math.nan] * (len(headers) - len(answers)))
+        answers_by_company[company] = answers
+
+    return SurveyWorkbook(headers, answers_by_company)
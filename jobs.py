@@ -0,0 +1,110 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Default number of jobs running at the same time in one server process
+DEFAULT_JOB_WORKERS = 4
+
+# Finished jobs are forgotten after this many seconds
+FINISHED_JOB_TTL = 60 * 60
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    # State of one background job. The worker thread updates progress and
+    # partial results while the Streamlit script polls them on every rerun.
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.done = 0
+        self.total = 0
+        self.partial = {}
+        self.text = ""
+        self.errors = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._cancel = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        # Ask the job to stop, e.g. when its result is no longer needed; the
+        # job function checks cancelled between steps
+        self._cancel.set()
+
+    @property
+    def progress(self):
+        return self.done / self.total if self.total else 0.0
+
+    def update(self, done, total):
+        self.done = done
+        self.total = total
+
+
+class JobManager:
+    # Process-wide worker pool for long running LLM work, so it is not tied
+    # to (and interrupted with) a single run of the Streamlit script
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        # Run fn(job, *args, **kwargs) in the pool; its return value becomes
+        # job.result. Returns the job id.
+        job = Job(kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def get(self, job_id):
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            # Cancelled while queued, the worker is free for the next job
+            job.status = CANCELLED
+            job.finished = time.time()
+            return
+        job.status = RUNNING
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = CANCELLED if job.cancelled else DONE
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and now - job.finished > FINISHED_JOB_TTL]:
+            del self._jobs[job_id]
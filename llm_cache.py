@@ -0,0 +1,151 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Defaults for the persistent LLM result cache
+DEFAULT_CACHE_PATH = ".llm_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 days
+
+# Expired and surplus entries are removed every this many writes; both
+# deletes scan the table, which is too slow to do on every write
+EVICT_EVERY = 500
+
+
+def make_cache_key(kind, model, temperature, prompt_version, payload):
+    # Content-addressed key: any change to the model settings, the prompt
+    # template version or the input itself results in a different key
+    raw = json.dumps(
+        [kind, model, temperature, prompt_version, payload],
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    # Disk-backed cache for rating and summary results, shared by all threads
+    # of the process. Entries expire after ttl_seconds and the least recently
+    # used entries are evicted once more than max_entries are stored (checked
+    # every EVICT_EVERY writes, so the table may briefly hold a few more).
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created)")
+        self._conn.commit()
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                self.misses += 1
+                return default
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def get_many(self, keys):
+        # {key: value} for all keys found, looked up in chunks of one query
+        now = time.time()
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created FROM llm_cache WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                valid = [(key, value) for key, value, created in rows
+                         if not (self.ttl_seconds and now - created > self.ttl_seconds)]
+                self._conn.executemany("UPDATE llm_cache SET accessed = ? WHERE key = ?",
+                                       [(now, key) for key, _ in valid])
+                found.update((key, json.loads(value)) for key, value in valid)
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def contains_many(self, keys):
+        # The keys with a valid entry; a cheap probe that neither counts as a
+        # hit or miss nor marks the entries as used
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds else None
+        found = set()
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, created FROM llm_cache WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(key for key, created in rows if cutoff is None or created >= cutoff)
+        return found
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if entries <= self.max_entries:
+                return
+            self._conn.execute(
+                """DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
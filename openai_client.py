@@ -0,0 +1,56 @@
+import importlib.util
+
+from openai import OpenAI, DefaultHttpxClient, Timeout, DEFAULT_CONNECTION_LIMITS
+
+# The SDK's HTTP connection limits class, taken from its defaults so the
+# code does not depend on how the bundled HTTP library is packaged
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+# Connection pool shared by all sessions of one server process: enough for
+# every job worker running its rating requests in parallel
+MAX_CONNECTIONS = 128
+MAX_KEEPALIVE_CONNECTIONS = 64
+KEEPALIVE_EXPIRY = 120.0
+
+# Connecting must be quick; a response (or the next chunk of a stream) may
+# take a while
+REQUEST_TIMEOUT = Timeout(90.0, connect=5.0, pool=30.0)
+
+# Retries of the SDK itself. Ratings are retried per row by the rating
+# engine, so the shared client does not retry; the executive summary uses
+# with_options(max_retries=SUMMARY_MAX_RETRIES).
+CLIENT_MAX_RETRIES = 0
+SUMMARY_MAX_RETRIES = 2
+
+
+def http2_available():
+    # HTTP/2 needs the optional h2 package
+    return importlib.util.find_spec("h2") is not None
+
+
+def make_http_client(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                     keepalive_expiry=KEEPALIVE_EXPIRY, timeout=REQUEST_TIMEOUT):
+    # Keep-alive connection pool, multiplexing requests over HTTP/2 if possible
+    return DefaultHttpxClient(
+        limits=Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=timeout,
+        http2=http2_available(),
+    )
+
+
+def make_client(api_key, base_url=None, max_connections=MAX_CONNECTIONS, max_retries=CLIENT_MAX_RETRIES,
+                timeout=REQUEST_TIMEOUT):
+    # OpenAI client with a tuned connection pool. Build it once per process
+    # and share it between threads and sessions, so requests reuse warm
+    # connections and TLS sessions instead of paying the handshake each time.
+    http_client = make_http_client(
+        max_connections=max_connections,
+        max_keepalive_connections=min(max_connections, MAX_KEEPALIVE_CONNECTIONS),
+        timeout=timeout,
+    )
+    return OpenAI(api_key=api_key, base_url=base_url, max_retries=max_retries, timeout=timeout,
+                  http_client=http_client)
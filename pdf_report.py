@@ -0,0 +1,123 @@
+import io
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# Page layout of the PDF report
+PAGE_MARGIN = 2 * cm
+CHART_WIDTH = 14 * cm
+
+# Widths of the rating table columns, the rest share what is left
+COLUMN_WIDTHS = {"Kategorie": 3.2 * cm, "Bewertung (1-5)": 2.2 * cm, "Frage": 5 * cm}
+
+_styles = getSampleStyleSheet()
+_cell_style = ParagraphStyle("Cell", parent=_styles["BodyText"], fontSize=8, leading=10)
+_header_style = ParagraphStyle("HeaderCell", parent=_cell_style, fontName="Helvetica-Bold")
+
+_TABLE_STYLE = TableStyle([
+    ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#dce6f1")),
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ("FONT", (0, 0), (-1, -1), _cell_style.fontName, _cell_style.fontSize, _cell_style.leading),
+    ("FONT", (0, 0), (-1, 0), _header_style.fontName, _header_style.fontSize, _header_style.leading),
+])
+
+# Left plus right padding of a table cell
+_CELL_PADDING = 12
+
+
+def _markup(text):
+    # Plain text as reportlab paragraph markup, keeping line breaks
+    return escape(str(text)).replace("\r\n", "\n").replace("\n", "<br/>")
+
+
+def _column_widths(columns, total):
+    fixed = sum(COLUMN_WIDTHS.get(column, 0) for column in columns)
+    flexible = [column for column in columns if column not in COLUMN_WIDTHS]
+    rest = (total - fixed) / len(flexible) if flexible else 0
+    return [COLUMN_WIDTHS.get(column, rest) for column in columns]
+
+
+def _cell(value, style, width):
+    # Values fitting on one line are drawn as plain strings; wrapping
+    # paragraphs take most of the layout time of a long table
+    text = str(value)
+    if "\n" not in text and stringWidth(text, style.fontName, style.fontSize) <= width - _CELL_PADDING:
+        return text
+    return Paragraph(_markup(text), style)
+
+
+def _table(rows, widths):
+    header, *body = rows
+    data = [[_cell(value, _header_style, width) for value, width in zip(header, widths)]]
+    data += [[_cell(value, _cell_style, width) for value, width in zip(row, widths)] for row in body]
+    table = Table(data, colWidths=widths, repeatRows=1)
+    table.setStyle(_TABLE_STYLE)
+    return table
+
+
+def build_pdf(chart_png, df, executive_summary, company_name, averages):
+    # The report of build_document as a PDF: company name, executive
+    # summary, spider chart with the category averages it shows, and the
+    # table of all questions with their ratings
+    company_name = str(company_name)
+    buffer = io.BytesIO()
+    document = SimpleDocTemplate(
+        buffer, pagesize=A4, title=company_name,
+        leftMargin=PAGE_MARGIN, rightMargin=PAGE_MARGIN, topMargin=PAGE_MARGIN, bottomMargin=PAGE_MARGIN,
+    )
+
+    story = [Paragraph(_markup(company_name), _styles["Title"])]
+
+    story.append(Paragraph("Executive Summary", _styles["Heading2"]))
+    for paragraph in str(executive_summary).split("\n\n"):
+        if paragraph.strip():
+            story.append(Paragraph(_markup(paragraph.strip()), _styles["BodyText"]))
+
+    if chart_png:
+        pixels_wide, pixels_high = ImageReader(io.BytesIO(chart_png)).getSize()
+        story.append(Spacer(1, 0.5 * cm))
+        story.append(Image(io.BytesIO(chart_png), width=CHART_WIDTH, height=CHART_WIDTH * pixels_high / pixels_wide))
+
+    story.append(Paragraph("Durchschnitt je Kategorie", _styles["Heading2"]))
+    story.append(_table(
+        [["Kategorie", "Durchschnitt"]] + [[kategorie, f"{mean:.1f}"] for kategorie, mean in averages.items()],
+        [document.width - 3 * cm, 3 * cm],
+    ))
+
+    story.append(Paragraph("Bewertungen", _styles["Heading2"]))
+    columns = [str(column) for column in df.columns]
+    story.append(_table(
+        [columns] + [list(row) for row in df.itertuples(index=False, name=None)],
+        _column_widths(columns, document.width),
+    ))
+
+    def footer(canvas, doc):
+        # Company and page number, so pages stay attributable in a binder
+        canvas.saveState()
+        canvas.setFont("Helvetica", 8)
+        canvas.drawString(PAGE_MARGIN, PAGE_MARGIN / 2, company_name)
+        canvas.drawRightString(A4[0] - PAGE_MARGIN, PAGE_MARGIN / 2, f"Seite {doc.page}")
+        canvas.restoreState()
+
+    document.build(story, onFirstPage=footer, onLaterPages=footer)
+    buffer.seek(0)
+    return buffer
+
+
+def merge_pdfs(reports, target):
+    # Merge (title, PDF bytes) pairs into one binder written to target, with
+    # a bookmark per report
+    from PyPDF2 import PdfMerger
+
+    merger = PdfMerger()
+    for title, pdf in reports:
+        merger.append(io.BytesIO(pdf), outline_item=str(title))
+    merger.write(target)
+    merger.close()
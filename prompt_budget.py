@@ -0,0 +1,102 @@
+import functools
+import math
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character based estimate
+    tiktoken = None
+
+# Rough characters per token, used when no local tokenizer is available
+CHARS_PER_TOKEN = 4
+
+# Appended to answers that were shortened to fit the budget
+TRUNCATION_MARK = " […]"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_encoding_lock = threading.Lock()
+
+
+def _encoding(model):
+    # Loading an encoding may download it; rating threads starting at the
+    # same time must not all try at once
+    with _encoding_lock:
+        return _load_encoding(model)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # Unknown model or the encoding files cannot be loaded
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+
+def count_tokens(text, model):
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text, max_tokens, model):
+    # Cut text down to at most max_tokens tokens, marking the cut
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return TRUNCATION_MARK.strip()
+    encoding = _encoding(model)
+    if encoding is None:
+        cut = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text)[:max_tokens])
+    return cut.rstrip() + TRUNCATION_MARK
+
+
+def compact_text(value):
+    # Collapse runs of whitespace (including line breaks) into single spaces
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return _WHITESPACE_RE.sub(" ", str(value)).strip()
+
+
+def fit_to_budget(render, texts, budget, model):
+    # Shorten the longest texts first until render(texts) fits into budget
+    # tokens. All texts above a common cap are cut to that cap, which is
+    # chosen as large as the budget allows. Returns (prompt, texts).
+    prompt = render(texts)
+    if count_tokens(prompt, model) <= budget or not texts:
+        return prompt, texts
+
+    overhead = count_tokens(render([""] * len(texts)), model)
+    available = max(0, budget - overhead)
+    lengths = [count_tokens(text, model) for text in texts]
+
+    # Largest cap with sum(min(length, cap)) <= available
+    cap = 0
+    remaining = available
+    ordered = sorted(lengths)
+    for position, length in enumerate(ordered):
+        share = remaining // (len(ordered) - position)
+        if length > share:
+            cap = share
+            break
+        remaining -= length
+    else:
+        cap = ordered[-1]
+
+    while True:
+        shortened = [truncate_tokens(text, cap, model) for text in texts]
+        prompt = render(shortened)
+        if count_tokens(prompt, model) <= budget or cap == 0:
+            return prompt, shortened
+        # Truncation marks and tokenizer boundaries can overshoot slightly
+        cap = int(cap * 0.9)
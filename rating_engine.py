@@ -0,0 +1,297 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from llm_cache import make_cache_key
+
+# Model settings used for all rating requests
+RATING_MODEL = "gpt-4o"
+RATING_TEMPERATURE = 0.7
+
+# Bump whenever the rating prompts change, so cached ratings are not reused
+RATING_PROMPT_VERSION = 1
+
+# Defaults for the concurrent rating engine
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BASE_DELAY = 1.0
+MAX_BACKOFF_DELAY = 30.0
+
+# Rating used when a row cannot be rated at all
+FALLBACK_RATING = 1
+
+# Batch mode: number of rows of the same Kategorie packed into one request
+DEFAULT_BATCH_SIZE = 1
+MAX_BATCH_SIZE = 25
+
+# Seconds between checks of should_stop while requests are running
+STOP_POLL_INTERVAL = 0.5
+
+
+def build_rating_prompt(row):
+    return f"""Erstelle mir eine Bewertung des folgenden Textes, nach einem Punkte System 1-5 (1 schlecht und 5 gut):
+Kategorie: {row['Kategorie']}
+Frage: {row['Frage']}
+Antwort: {row['Antwort']}
+Gib nur eine ganze Zahl zwischen 1 und 5 zurück. Wenn keine Antwort vorhanden ist oder die Daten für eine Bewertung unzureichend sind, gib 1 zurück."""
+
+
+def parse_rating(text):
+    # Ensure the rating is an integer between 1 and 5
+    return max(1, min(5, int(float(text.strip()))))
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status
+
+
+def _is_retryable(error):
+    # Rate limits, server errors and connection problems are worth retrying,
+    # everything else (bad request, auth, unparsable answer) is not
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "RateLimitError")
+
+
+def _retry_delay(error, attempt, base_delay):
+    # Honour the server's Retry-After header on rate limits if present
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+    if retry_after:
+        try:
+            return min(MAX_BACKOFF_DELAY, float(retry_after))
+        except ValueError:
+            pass
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(MAX_BACKOFF_DELAY, base_delay * 2 ** attempt))
+
+
+def _with_retries(call, max_retries, base_delay, on_retry=None):
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            time.sleep(_retry_delay(e, attempt, base_delay))
+            attempt += 1
+
+
+def rate_row(client, row, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY, on_retry=None):
+    prompt = build_rating_prompt(row)
+
+    def call():
+        response = client.chat.completions.create(
+            model=RATING_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=RATING_TEMPERATURE
+        )
+        return parse_rating(response.choices[0].message.content)
+
+    return _with_retries(call, max_retries, base_delay, on_retry)
+
+
+def build_batch_prompt(kategorie, items):
+    # items is a list of (row_id, row) pairs that all belong to kategorie
+    questions = "\n\n".join(
+        f"ID: {row_id}\nFrage: {row['Frage']}\nAntwort: {row['Antwort']}"
+        for row_id, row in items
+    )
+    return f"""Erstelle mir eine Bewertung der folgenden Antworten, nach einem Punkte System 1-5 (1 schlecht und 5 gut).
+Kategorie: {kategorie}
+
+{questions}
+
+Bewerte jede Antwort einzeln. Wenn keine Antwort vorhanden ist oder die Daten für eine Bewertung unzureichend sind, vergib 1.
+Gib ausschliesslich ein JSON-Objekt in folgendem Format zurück:
+{{"ratings": [{{"id": <ID>, "rating": <ganze Zahl zwischen 1 und 5>}}]}}"""
+
+
+def parse_batch_ratings(text, expected_ids):
+    # Validate the model's JSON answer against the expected schema and return
+    # {row_id: rating} for every valid entry. Unknown, duplicate or malformed
+    # entries are dropped so the caller can re-rate those rows on their own.
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return {}
+    entries = data.get("ratings") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        return {}
+
+    expected = set(expected_ids)
+    ratings = {}
+    duplicates = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        row_id = entry.get("id")
+        rating = entry.get("rating")
+        if isinstance(row_id, str) and row_id.strip().isdigit():
+            row_id = int(row_id)
+        if isinstance(row_id, bool) or row_id not in expected:
+            continue
+        if isinstance(rating, bool) or not isinstance(rating, (int, float)) or rating != int(rating):
+            continue
+        if not 1 <= rating <= 5:
+            continue
+        if row_id in ratings:
+            duplicates.add(row_id)
+        ratings[row_id] = int(rating)
+    for row_id in duplicates:
+        del ratings[row_id]
+    return ratings
+
+
+def rate_batch(client, kategorie, items, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY,
+               on_retry=None):
+    prompt = build_batch_prompt(kategorie, items)
+    expected_ids = [row_id for row_id, _ in items]
+
+    def call():
+        response = client.chat.completions.create(
+            model=RATING_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=RATING_TEMPERATURE,
+            response_format={"type": "json_object"}
+        )
+        return parse_batch_ratings(response.choices[0].message.content, expected_ids)
+
+    return _with_retries(call, max_retries, base_delay, on_retry)
+
+
+def rating_cache_key(row):
+    return make_cache_key(
+        "rating",
+        RATING_MODEL,
+        RATING_TEMPERATURE,
+        RATING_PROMPT_VERSION,
+        [row['Kategorie'], row['Frage'], row['Antwort']],
+    )
+
+
+def _make_batches(rows, positions, batch_size):
+    # Group row positions by Kategorie (in order of first appearance) and
+    # split each group into chunks of at most batch_size rows
+    groups = {}
+    for position in positions:
+        groups.setdefault(rows[position]['Kategorie'], []).append(position)
+    batches = []
+    for kategorie, positions in groups.items():
+        for start in range(0, len(positions), batch_size):
+            batches.append((kategorie, positions[start:start + batch_size]))
+    return batches
+
+
+def rate_rows(client, df, concurrency=DEFAULT_CONCURRENCY, max_retries=DEFAULT_MAX_RETRIES,
+              base_delay=DEFAULT_BASE_DELAY, batch_size=DEFAULT_BATCH_SIZE, cache=None, known=None,
+              on_progress=None, on_error=None, on_result=None, on_retry=None, should_stop=None):
+    # Rate all rows of df concurrently and return the ratings in row order.
+    # With batch_size > 1, rows of the same Kategorie are rated together and
+    # any row missing from a batch answer is re-rated on its own.
+    # If an LLMCache is given, unchanged rows are answered from the cache and
+    # only new or edited rows are sent to the API. known maps row positions
+    # to ratings that are already available, e.g. from an interrupted run.
+    # on_progress(done, total), on_error(exception) and on_result(position,
+    # rating) are called from the calling thread, so they may safely update
+    # Streamlit elements. on_retry(exception) is called from the worker
+    # threads before a failed request is retried. Once should_stop() returns
+    # True, requests not sent yet are dropped and the ratings so far returned
+    # (FALLBACK_RATING for the rest).
+    rows = [row for _, row in df.iterrows()]
+    total = len(rows)
+    ratings = [FALLBACK_RATING] * total
+    if total == 0:
+        return ratings
+    batch_size = max(1, min(MAX_BATCH_SIZE, int(batch_size)))
+
+    done = 0
+    to_rate = []
+    for position, row in enumerate(rows):
+        if known and position in known:
+            rating = known[position]
+        else:
+            rating = cache.get(rating_cache_key(row)) if cache is not None else None
+        if rating is not None:
+            ratings[position] = rating
+            done += 1
+            if on_result is not None:
+                on_result(position, rating)
+        else:
+            to_rate.append(position)
+    if on_progress is not None and done:
+        on_progress(done, total)
+
+    def store(position, rating):
+        ratings[position] = rating
+        if cache is not None:
+            cache.set(rating_cache_key(rows[position]), rating)
+        if on_result is not None:
+            on_result(position, rating)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(concurrency))) as executor:
+        # future -> (is_batch, row positions covered by the request)
+        pending = {}
+
+        def submit_single(position):
+            pending[executor.submit(rate_row, client, rows[position], max_retries, base_delay, on_retry)] = (False, [position])
+
+        if batch_size == 1:
+            for position in to_rate:
+                submit_single(position)
+        else:
+            for kategorie, positions in _make_batches(rows, to_rate, batch_size):
+                items = [(position, rows[position]) for position in positions]
+                pending[executor.submit(rate_batch, client, kategorie, items, max_retries, base_delay, on_retry)] = (True, positions)
+
+        while pending:
+            if should_stop is not None and should_stop():
+                for future in pending:
+                    future.cancel()
+                break
+            finished, _ = wait(pending, timeout=STOP_POLL_INTERVAL if should_stop is not None else None,
+                               return_when=FIRST_COMPLETED)
+            for future in finished:
+                is_batch, positions = pending.pop(future)
+                if is_batch:
+                    try:
+                        result = future.result()
+                    except Exception:
+                        # The whole batch failed, fall back to single-row requests
+                        result = {}
+                    for position in positions:
+                        if position in result:
+                            store(position, result[position])
+                            done += 1
+                        else:
+                            submit_single(position)
+                else:
+                    try:
+                        store(positions[0], future.result())
+                    except Exception as e:
+                        if on_error is not None:
+                            on_error(e)
+                    done += 1
+                if on_progress is not None:
+                    on_progress(done, total)
+
+    return ratings
@@ -0,0 +1,322 @@
+import io
+
+import pandas as pd
+import plotly.graph_objects as go
+
+from docx_stream import get_streaming_template
+from llm_cache import make_cache_key
+from pdf_report import build_pdf
+from prompt_budget import compact_text, count_tokens, fit_to_budget
+from template_engine import get_compiled_template, report_replacements
+
+# Default Word template
+TEMPLATE_PATH = "template.docx"
+
+# Workbook layout: company names in column F, questions from column H onwards
+COMPANY_COLUMN = 5
+FIRST_QUESTION_COLUMN = 7
+
+# Executive summary model settings; bump the version whenever the prompt changes
+SUMMARY_MODEL = "gpt-4o"
+SUMMARY_TEMPERATURE = 0.7
+SUMMARY_PROMPT_VERSION = 2
+
+# Upper limit for the size of the executive summary prompt
+SUMMARY_TOKEN_BUDGET = 12000
+
+
+def split_header(header):
+    parts = header.split("-", 1)
+    if len(parts) == 2:
+        return parts[0].rstrip(), parts[1].lstrip()
+    return "", header
+
+
+def category_averages(df):
+    # Mean rating per Kategorie, in order of first appearance
+    return df.groupby('Kategorie', sort=False)['Bewertung (1-5)'].mean()
+
+
+def create_spider_chart(df):
+    return spider_chart_from_averages(category_averages(df))
+
+
+def spider_chart_from_averages(averages):
+    fig = go.Figure(data=[
+        go.Scatterpolar(
+            r=averages.values,
+            theta=averages.index,
+            fill='toself',
+            line=dict(color='rgb(31, 119, 180)'),  # Blue color
+        )
+    ])
+
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 5]
+            )
+        ),
+        showlegend=False,
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        plot_bgcolor='rgba(0,0,0,0)'    # Transparent plot area
+    )
+
+    return fig
+
+
+def comparison_spider_chart(company_averages, peer_averages, company_name, peers_label="Peer-Durchschnitt"):
+    # The company's category means overlaid on the peers' means
+    fig = go.Figure(data=[
+        go.Scatterpolar(
+            r=peer_averages.values,
+            theta=peer_averages.index,
+            fill='toself',
+            name=peers_label,
+            line=dict(color='rgb(160, 160, 160)'),  # Grey for the peers
+        ),
+        go.Scatterpolar(
+            r=company_averages.values,
+            theta=company_averages.index,
+            fill='toself',
+            name=str(company_name),
+            line=dict(color='rgb(31, 119, 180)'),  # Blue color
+        ),
+    ])
+
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 5]
+            )
+        ),
+        showlegend=True,
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        plot_bgcolor='rgba(0,0,0,0)'    # Transparent plot area
+    )
+
+    return fig
+
+
+def list_companies(df):
+    # Company names from column F (index 5)
+    return df.iloc[:, COMPANY_COLUMN].dropna().unique()
+
+
+def frame_from_answers(headers, answers):
+    # Split headers into Kategorie and Frage
+    kategorien, fragen = zip(*[split_header(header) for header in headers])
+
+    # Create a new dataframe with Kategorie, Frage, and Answer
+    return pd.DataFrame({
+        "Kategorie": kategorien,
+        "Frage": fragen,
+        "Antwort": list(answers),
+        "Bewertung (1-5)": [""] * len(answers)  # Empty column for ratings
+    })
+
+
+def build_company_frame(df, company):
+    # Filter the dataframe for the selected company
+    selected_row = df[df.iloc[:, COMPANY_COLUMN] == company].iloc[0]
+
+    # Process the headers and create the new dataframe
+    headers = df.columns[FIRST_QUESTION_COLUMN:]  # Start from column H (index 7)
+    answers = selected_row.iloc[FIRST_QUESTION_COLUMN:]  # Corresponding answers
+
+    return frame_from_answers(headers, answers)
+
+
+def normalize_ratings(df):
+    # Convert ratings to integers and handle any non-numeric values
+    df['Bewertung (1-5)'] = pd.to_numeric(df['Bewertung (1-5)'], errors='coerce').fillna(1).clip(1, 5).astype(int)
+    return df
+
+
+def changed_rows(before, after, column):
+    # Positions of the rows whose value in column differs between two frames
+    # of the same questionnaire; ratings are compared as numbers
+    old = before[column].reset_index(drop=True)
+    new = after[column].reset_index(drop=True)
+    if column == 'Bewertung (1-5)':
+        old = pd.to_numeric(old, errors='coerce')
+        new = pd.to_numeric(new, errors='coerce')
+    differs = (old != new) & ~(old.isna() & new.isna())
+    return list(differs[differs].index)
+
+
+def summary_inputs_key(df):
+    # Changes whenever anything the executive summary is based on changes
+    columns = ['Kategorie', 'Frage', 'Antwort', 'Bewertung (1-5)']
+    return make_cache_key("summary-inputs", SUMMARY_MODEL, SUMMARY_TEMPERATURE, SUMMARY_PROMPT_VERSION,
+                          df[columns].astype(str).values.tolist())
+
+
+def _summary_prompt(overview, details):
+    return f"""Erstelle eine Executive Summary basierend auf den folgenden Daten:
+
+Gesamtbewertungen nach Kategorie:
+{overview}
+
+Detaillierte Informationen:
+{details}
+
+Bitte erstelle eine umfassende Executive Summary, die:
+1. Die durchschnittlichen Bewertungen für jede Kategorie hervorhebt
+2. Bemerkenswerte Einzelaspekte aus jeder Kategorie diskutiert
+3. Eine Gesamtbewertung der Leistung des Unternehmens über alle Kategorien hinweg liefert
+
+Die Zusammenfassung sollte prägnant, aber informativ sein und für eine Überprüfung auf Führungsebene geeignet sein. 
+Bitte verwende Schweizer Rechtschreibung und Grammatik. Starte den Bericht nicht mit einem Titel, sonder beginne direkt mit dem Inhalt. Keine fettgedruckte Formatierung."""
+
+
+def build_summary_prompt(df, token_budget=SUMMARY_TOKEN_BUDGET, stage=None):
+    # Prepare the data for the prompt: category means and one compact line
+    # per question, grouped by category, without the fixed-width padding of
+    # DataFrame.to_string. If the prompt exceeds token_budget, the longest
+    # answers are shortened first. With a tracing stage, the token counts
+    # before and after compaction are recorded on it.
+    means = category_averages(df)
+    overview = "\n".join(f"{kategorie}: {mean:.2f}" for kategorie, mean in means.items())
+
+    order = [position for positions in df.groupby('Kategorie', sort=False).indices.values() for position in positions]
+    kategorien = df['Kategorie'].to_numpy()
+    fragen = [compact_text(frage) for frage in df['Frage']]
+    ratings = df['Bewertung (1-5)'].to_numpy()
+    answers = [compact_text(antwort) for antwort in df['Antwort']]
+
+    def render(answers):
+        lines = []
+        for position in order:
+            if not lines or kategorien[position] != kategorien[previous]:
+                lines.append(f"{kategorien[position]}:")
+            lines.append(f"- {fragen[position]} | Antwort: {answers[position] or '(keine Antwort)'} | Bewertung: {ratings[position]}")
+            previous = position
+        return _summary_prompt(overview, "\n".join(lines))
+
+    prompt, _ = fit_to_budget(render, answers, token_budget, SUMMARY_MODEL)
+
+    if stage is not None:
+        # Savings against the previous padded table format
+        categories = means.sort_index().round(2).reset_index()
+        original = _summary_prompt(categories.to_string(index=False), df.to_string(index=False))
+        stage.record["prompt_tokens_before_compaction"] = count_tokens(original, SUMMARY_MODEL)
+        stage.record["prompt_tokens_after_compaction"] = count_tokens(prompt, SUMMARY_MODEL)
+        stage.record["token_budget"] = token_budget
+
+    return prompt
+
+
+def summary_cache_key(prompt):
+    return make_cache_key("summary", SUMMARY_MODEL, SUMMARY_TEMPERATURE, SUMMARY_PROMPT_VERSION, prompt)
+
+
+def generate_executive_summary(client, df, cache=None, token_budget=SUMMARY_TOKEN_BUDGET, raise_errors=False,
+                               stage=None):
+    # With raise_errors, a failed request raises instead of returning the
+    # error message as the summary, e.g. so the batch CLI counts it as failed
+    prompt = build_summary_prompt(df, token_budget, stage)
+
+    # Reuse a previously generated summary for identical input
+    cache_key = summary_cache_key(prompt)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    try:
+        response = client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=SUMMARY_TEMPERATURE
+        )
+        summary = response.choices[0].message.content.strip()
+        if cache is not None:
+            cache.set(cache_key, summary)
+        return summary
+    except Exception as e:
+        if raise_errors:
+            raise
+        return f"Fehler bei der Generierung der Executive Summary: {e}"
+
+
+def stream_executive_summary(client, df, cache=None, token_budget=SUMMARY_TOKEN_BUDGET, stage=None):
+    # Yield the executive summary piece by piece as the model produces it.
+    # Errors are raised to the caller; the summary is cached only once the
+    # stream has completed, and the HTTP stream is closed when the consumer
+    # stops early (e.g. Streamlit interrupting the script on a rerun).
+    prompt = build_summary_prompt(df, token_budget, stage)
+
+    cache_key = summary_cache_key(prompt)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    stream = client.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        temperature=SUMMARY_TEMPERATURE,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    chunks = []
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                chunks.append(text)
+                yield text
+    finally:
+        stream.close()
+
+    if cache is not None:
+        cache.set(cache_key, "".join(chunks).strip())
+
+
+def build_document(chart_png, df, executive_summary, company_name, template_path=TEMPLATE_PATH, stage=None):
+    # Parsed once per process, reparsed only when the template file changes
+    compiled = get_compiled_template(template_path)
+    if stage is not None:
+        stage.record["placeholder_paragraphs"] = len(compiled.index)
+
+    # Fill all placeholders of a fresh copy of the template
+    values = report_replacements(df, executive_summary, company_name)
+    template = compiled.render(values, images={"Spider_Chart": io.BytesIO(chart_png)})
+
+    # Save the generated document to a buffer
+    buffer = io.BytesIO()
+    template.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def build_reports(chart_png, df, executive_summary, company_name, template_path=TEMPLATE_PATH, stage=None):
+    # Word and PDF version of the same report from one rendered chart and one
+    # set of category averages. Returns both buffers.
+    averages = category_averages(df)
+    document = build_document(chart_png, df, executive_summary, company_name, template_path, stage)
+    return document, build_pdf(chart_png, df, executive_summary, company_name, averages)
+
+
+def write_document(target, chart_png, df, executive_summary, company_name, template_path=TEMPLATE_PATH):
+    # Same report as build_document, written at zip level straight into
+    # target (any writable binary stream, e.g. a member of a zip download)
+    # without building the python-docx object model
+    values = report_replacements(df, executive_summary, company_name)
+    get_streaming_template(template_path).write(target, values, images={"Spider_Chart": chart_png})
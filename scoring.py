@@ -0,0 +1,198 @@
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from rating_engine import rating_cache_key
+
+RATING_COLUMN = "Bewertung (1-5)"
+
+# Peer benchmarks computed per Kategorie, as (label, percentile)
+BENCHMARK_PERCENTILES = [("p25", 25), ("Median", 50), ("p75", 75), ("p90", 90)]
+
+
+class Aggregates:
+    # Everything derived from one state of a ScoreTable, computed together:
+    # means is a companies x Kategorie frame, overall the mean of all of a
+    # company's ratings, benchmarks a statistic x Kategorie frame across
+    # companies and ranks the percentile rank (0-100) of every company's
+    # category mean among all companies
+
+    def __init__(self, companies, kategorien, sums, counts):
+        # Categories nobody has a rating in are NaN, without warnings
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            means = sums / counts
+            overall = sums.sum(axis=1) / counts.sum(axis=1)
+            rows = {"Durchschnitt": np.nanmean(means, axis=0) if len(companies) else np.full(len(kategorien), np.nan)}
+            for label, percentile in BENCHMARK_PERCENTILES:
+                rows[label] = (np.nanpercentile(means, percentile, axis=0) if len(companies)
+                               else np.full(len(kategorien), np.nan))
+        self.sums = sums
+        self.counts = counts
+        self.means = pd.DataFrame(means, index=pd.Index(companies, name="company"),
+                                  columns=pd.Index(kategorien, name="Kategorie"))
+        self.overall = pd.Series(overall, index=self.means.index, name="Gesamt")
+        self.benchmarks = pd.DataFrame(rows, index=self.means.columns).T
+        self.ranks = self.means.rank(pct=True) * 100
+
+
+def _same_entry(a, b):
+    return (len(a[2]) == len(b[2]) and np.array_equal(a[2], b[2], equal_nan=True)
+            and np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1]))
+
+
+def _encode(values, codes):
+    # Integer codes of values, new values are appended to the codes dict
+    local_codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    lookup = np.array([codes.setdefault(value, len(codes)) for value in uniques], dtype=np.int64)
+    return lookup[local_codes]
+
+
+class ScoreTable:
+    # Ratings of all rated companies in one long-format table (company,
+    # Kategorie, Frage, rating) with categorical columns. Companies are added
+    # or replaced one at a time; the table and all aggregates are rebuilt
+    # lazily, with one vectorised pass over the ratings, the first time they
+    # are needed after a change. Safe to share between sessions.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # company -> (Kategorie codes, Frage codes, ratings) arrays
+        self._companies = {}
+        # Kategorie and Frage values -> codes, in order of first appearance
+        self._kategorie_codes = {}
+        self._frage_codes = {}
+        self._table = None
+        self._aggregates = None
+
+    def __len__(self):
+        return len(self._companies)
+
+    def __contains__(self, company):
+        return company in self._companies
+
+    @property
+    def companies(self):
+        return list(self._companies)
+
+    def set_company(self, company, df):
+        # Add or replace one company's ratings from its report frame
+        ratings = pd.to_numeric(df[RATING_COLUMN], errors="coerce").to_numpy(dtype=float)
+        with self._lock:
+            entry = (_encode(df["Kategorie"], self._kategorie_codes), _encode(df["Frage"], self._frage_codes), ratings)
+            # Unchanged ratings keep the table and aggregates, e.g. on reruns
+            current = self._companies.get(company)
+            if current is not None and _same_entry(current, entry):
+                return
+            self._companies[company] = entry
+            self._table = None
+            self._aggregates = None
+
+    def remove_company(self, company):
+        with self._lock:
+            if self._companies.pop(company, None) is not None:
+                self._table = None
+                self._aggregates = None
+
+    def table(self):
+        # The long-format table; built from the per-company code arrays, so
+        # no strings are compared or hashed
+        with self._lock:
+            if self._table is None:
+                self._table = self._build_table()
+            return self._table
+
+    def _build_table(self):
+        companies = list(self._companies)
+        entries = list(self._companies.values())
+        lengths = [len(ratings) for _, _, ratings in entries]
+
+        def concat(position):
+            parts = [entry[position] for entry in entries]
+            return np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+
+        return pd.DataFrame({
+            "company": pd.Categorical.from_codes(np.repeat(np.arange(len(companies)), lengths),
+                                                 categories=pd.Index(companies, dtype=object)),
+            "Kategorie": pd.Categorical.from_codes(concat(0), categories=pd.Index(list(self._kategorie_codes), dtype=object)),
+            "Frage": pd.Categorical.from_codes(concat(1), categories=pd.Index(list(self._frage_codes), dtype=object)),
+            "rating": concat(2).astype(float),
+        })
+
+    def aggregates(self):
+        table = self.table()
+        with self._lock:
+            if self._aggregates is None:
+                self._aggregates = self._aggregate(table)
+            return self._aggregates
+
+    @staticmethod
+    def _aggregate(table):
+        # Sum and count of the ratings per (company, Kategorie) with a single
+        # bincount over the combined category codes; missing ratings count
+        # neither towards the sum nor the count
+        companies = table["company"].cat.categories
+        kategorien = table["Kategorie"].cat.categories
+        cells = len(companies) * len(kategorien)
+        codes = table["company"].cat.codes.to_numpy(dtype=np.int64) * len(kategorien) \
+            + table["Kategorie"].cat.codes.to_numpy(dtype=np.int64)
+        ratings = table["rating"].to_numpy(dtype=float)
+        valid = ~np.isnan(ratings)
+        sums = np.bincount(codes[valid], weights=ratings[valid], minlength=cells)
+        counts = np.bincount(codes[valid], minlength=cells).astype(float)
+        shape = (len(companies), len(kategorien))
+        return Aggregates(list(companies), list(kategorien), sums.reshape(shape), counts.reshape(shape))
+
+    def company_profile(self, company):
+        # Per Kategorie: the company's mean, the mean and the median of all
+        # other companies and the company's percentile rank
+        aggregates = self.aggregates()
+        position = aggregates.means.index.get_loc(company)
+        own_sums = aggregates.sums[position]
+        own_counts = aggregates.counts[position]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Each peer company weighs the same, regardless of its answer count
+            peer_totals = np.nansum(aggregates.means.to_numpy(), axis=0) - np.nan_to_num(own_sums / own_counts)
+            peer_counts = aggregates.means.notna().sum(axis=0).to_numpy() - (own_counts > 0)
+            peer_means = peer_totals / peer_counts
+        with warnings.catch_warnings():
+            # Categories no other company has a rating in are NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            peer_medians = np.nanmedian(np.delete(aggregates.means.to_numpy(), position, axis=0), axis=0)
+        return pd.DataFrame({
+            "Bewertung": aggregates.means.iloc[position],
+            "Peer-Durchschnitt": peer_means,
+            "Peer-Median": peer_medians,
+            "Perzentil": aggregates.ranks.iloc[position],
+        }, index=aggregates.means.columns)
+
+
+def cached_ratings(survey, cache, companies=None):
+    # Report frames of all companies whose every question already has a
+    # rating in the LLM cache, e.g. from the batch CLI or earlier sessions.
+    # The first question of every company is probed in one query, without
+    # touching the cache statistics; only companies that pass are checked
+    # in full, and only complete ones are read (and counted as hits).
+    candidates = {}
+    for company in survey.companies if companies is None else companies:
+        df = survey.company_frame(company)
+        if len(df):
+            # Same row objects as the rating engine, so the keys match exactly
+            candidates[company] = (df, rating_cache_key(next(df.iterrows())[1]))
+    present = cache.contains_many(key for _, key in candidates.values())
+
+    frames = {}
+    for company, (df, probe) in candidates.items():
+        if probe not in present:
+            continue
+        keys = [rating_cache_key(row) for _, row in df.iterrows()]
+        if len(cache.contains_many(keys)) < len(set(keys)):
+            continue
+        found = cache.get_many(keys)
+        if len(found) < len(keys):
+            continue
+        df[RATING_COLUMN] = [found[key] for key in keys]
+        frames[company] = df
+    return frames
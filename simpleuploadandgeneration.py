@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
 import io
-from openai import OpenAI
-from docx import Document
+from openai_client import make_client, SUMMARY_MAX_RETRIES
+from template_engine import get_compiled_template, row_replacements
 
 # Testing header to see if the deployment works
 st.header("Testing Deployment 15")
@@ -38,20 +38,17 @@ def update_row(index, value):
 def unlock_row(index):
     st.session_state[f'row_{index+1}_locked'] = False
 
+@st.cache_resource
+def get_openai_client():
+    # One pooled API client per server process, shared by all sessions
+    return make_client(api_key, st.secrets.get("openai_base_url"), max_retries=SUMMARY_MAX_RETRIES)
+
 def generate_document():
     try:
-        # Load the Word template
-        template = Document(template_path)
-
-        # Replace placeholders in the template
-        for paragraph in template.paragraphs:
-            if "{{Executive_Summary}}" in paragraph.text:
-                paragraph.text = paragraph.text.replace("{{Executive_Summary}}", st.session_state.summary)
-
-            for i, content in enumerate(st.session_state.edited_content):
-                placeholder = f"{{{{Row_{i+1}}}}}"
-                if placeholder in paragraph.text:
-                    paragraph.text = paragraph.text.replace(placeholder, str(content))
+        # Fill a fresh copy of the template, which is parsed once per process
+        values = row_replacements(st.session_state.edited_content)
+        values["Executive_Summary"] = st.session_state.summary
+        template = get_compiled_template(template_path).render(values)
 
         # Save the generated document to a buffer
         buffer = io.BytesIO()
@@ -66,8 +63,8 @@ def generate_document():
 # Check if the password is correct
 if password == "iken":
     if uploaded_file is not None:
-        # Initialize the OpenAI client once the API key is provided
-        client = OpenAI(api_key=api_key)
+        # Shared OpenAI client, built once per server process
+        client = get_openai_client()
 
         # Read Excel file into DataFrame (starting from the first row)
         df = pd.read_excel(uploaded_file, usecols="A", nrows=10)
@@ -0,0 +1,247 @@
+import copy
+import os
+import re
+import threading
+
+from docx import Document
+from docx.oxml.ns import qn
+from docx.shared import Inches
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+
+# Any {{Name}} token, e.g. {{Company_Name}}, {{c2r14}} or {{Row_3}}
+PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# Default width of pictures inserted for image placeholders
+DEFAULT_IMAGE_WIDTH = Inches(6)
+
+
+def table_replacements(df):
+    # {{cXrY}} values: row 0 is the header row, rows 1..n are the data rows
+    values = {f"c{col_index}r0": str(column) for col_index, column in enumerate(df.columns)}
+    for row_index, row in enumerate(df.itertuples(index=False, name=None), 1):
+        for col_index, value in enumerate(row):
+            values[f"c{col_index}r{row_index}"] = str(value)
+    return values
+
+
+def report_replacements(df, executive_summary, company_name):
+    # Lookup dict for all text placeholders of the report template
+    values = table_replacements(df)
+    values["Executive_Summary"] = executive_summary
+    values["Company_Name"] = str(company_name)
+    return values
+
+
+def row_replacements(rows):
+    # {{Row_N}} values, numbered from 1
+    return {f"Row_{index}": str(content) for index, content in enumerate(rows, 1)}
+
+
+def iter_stories(document):
+    # The document body followed by every distinct header and footer
+    yield document._body
+    seen = set()
+    for section in document.sections:
+        for story in (section.header, section.first_page_header, section.even_page_header,
+                      section.footer, section.first_page_footer, section.even_page_footer):
+            if story.is_linked_to_previous:
+                continue
+            part = story.part
+            if id(part) in seen:
+                continue
+            seen.add(id(part))
+            yield story
+
+
+def iter_paragraphs(document):
+    # Every paragraph of the document in one pass, including paragraphs in
+    # (nested) tables, text boxes, headers and footers
+    for story in iter_stories(document):
+        for p in story._element.iter(qn("w:p")):
+            yield Paragraph(p, story)
+
+
+def fill_paragraph(paragraph, values, images=None):
+    # Replace all placeholders of a paragraph in place. The replacement text
+    # takes the formatting of the run the placeholder starts in, so
+    # placeholders split across several runs by Word are handled as well.
+    # Returns the names of the placeholders that were replaced.
+    runs = paragraph.runs
+    if not runs:
+        return []
+    original = [run.text for run in runs]
+    text = "".join(original)
+    if "{{" not in text:
+        return []
+
+    matches = [m for m in PLACEHOLDER_RE.finditer(text)
+               if m.group(1) in values or (images and m.group(1) in images)]
+    if not matches:
+        return []
+
+    # Character offset at which each run starts
+    texts = list(original)
+    starts = []
+    offset = 0
+    for run_text in original:
+        starts.append(offset)
+        offset += len(run_text)
+
+    def run_at(position):
+        index = 0
+        while index + 1 < len(starts) and starts[index + 1] <= position:
+            index += 1
+        return index
+
+    pictures = []
+    # Work backwards so earlier offsets stay valid
+    for match in reversed(matches):
+        name = match.group(1)
+        first = run_at(match.start())
+        last = run_at(match.end() - 1)
+        head = texts[first][:match.start() - starts[first]]
+        tail = texts[last][match.end() - starts[last]:]
+        if name in values:
+            replacement = values[name]
+        else:
+            replacement = ""
+            pictures.append((first, len(head), images[name]))
+        if first == last:
+            texts[first] = head + replacement + tail
+        else:
+            texts[first] = head + replacement
+            for index in range(first + 1, last):
+                texts[index] = ""
+            texts[last] = tail
+
+    for run, new_text, old_text in zip(runs, texts, original):
+        if new_text != old_text:
+            run.text = new_text
+
+    # Insert pictures in the run their placeholder started in; the text after
+    # the placeholder moves to a run of its own so it stays behind the picture
+    for index, position, image in pictures:
+        run = runs[index]
+        after = run.text[position:]
+        run.text = run.text[:position]
+        if after:
+            tail_run = _split_run(run, after)
+            runs.insert(index + 1, tail_run)
+        if isinstance(image, tuple):
+            source, width = image
+        else:
+            source, width = image, DEFAULT_IMAGE_WIDTH
+        if hasattr(source, "seek"):
+            source.seek(0)
+        run.add_picture(source, width=width)
+
+    return [match.group(1) for match in matches]
+
+
+def _split_run(run, text):
+    # Insert a copy of run's formatting right after it, holding text
+    new_r = copy.deepcopy(run._r)
+    for child in list(new_r):
+        if child.tag != qn("w:rPr"):
+            new_r.remove(child)
+    run._r.addnext(new_r)
+    new_run = Run(new_r, run._parent)
+    new_run.text = text
+    return new_run
+
+
+def fill_document(document, values, images=None):
+    # Single pass over the whole document; values maps placeholder names to
+    # text, images maps placeholder names to a picture (path or file-like,
+    # optionally as a (source, width) tuple). Returns the set of replaced names.
+    replaced = set()
+    for paragraph in iter_paragraphs(document):
+        replaced.update(fill_paragraph(paragraph, values, images))
+    return replaced
+
+
+class CompiledTemplate:
+    # A Word template parsed once, with an index of the paragraphs holding
+    # placeholders. render() works on a copy of the parsed package, so the
+    # template file is not unzipped and parsed again for every report. Only
+    # the XML of the parts holding placeholders is copied; styles, theme,
+    # numbering and the other parts are never changed by rendering and are
+    # shared by all copies.
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        # Never accessed other than to copy it, python-docx objects cache
+        # references into the XML that a deep copy would not carry over
+        self._package = Document(path).part.package
+        self._shared = {}
+        self.index = self._build_index()
+        self._shared = self._shared_elements()
+
+    def _build_index(self):
+        # [(story number, paragraph number, placeholder names)] in document order
+        index = []
+        self._changed_parts = set()
+        for story_number, story in enumerate(iter_stories(self.new_document())):
+            for paragraph_number, p in enumerate(story._element.iter(qn("w:p"))):
+                text = "".join(run.text for run in Paragraph(p, story).runs)
+                if "{{" not in text:
+                    continue
+                names = PLACEHOLDER_RE.findall(text)
+                if names:
+                    index.append((story_number, paragraph_number, names))
+                    self._changed_parts.add(story.part.partname)
+        return index
+
+    def _shared_elements(self):
+        # deepcopy memo mapping the XML of unchanged parts to itself
+        shared = {}
+        for part in self._package.iter_parts():
+            element = getattr(part, "_element", None)
+            if element is not None and part.partname not in self._changed_parts:
+                shared[id(element)] = element
+        return shared
+
+    @property
+    def placeholders(self):
+        return {name for _, _, names in self.index for name in names}
+
+    def is_stale(self):
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return True
+
+    def new_document(self):
+        return copy.deepcopy(self._package, dict(self._shared)).main_document_part.document
+
+    def render(self, values, images=None):
+        # Fresh document with all placeholders filled; only the indexed
+        # paragraphs are visited
+        document = self.new_document()
+        stories = list(iter_stories(document))
+        paragraphs = {}
+        for story_number, paragraph_number, _ in self.index:
+            story = stories[story_number]
+            if story_number not in paragraphs:
+                paragraphs[story_number] = list(story._element.iter(qn("w:p")))
+            p = paragraphs[story_number][paragraph_number]
+            fill_paragraph(Paragraph(p, story), values, images)
+        return document
+
+
+# Process-wide cache of compiled templates, keyed by absolute path
+_compiled_templates = {}
+_compiled_templates_lock = threading.Lock()
+
+
+def get_compiled_template(path):
+    # Compiled template for path, recompiled when the file's mtime changes
+    key = os.path.abspath(path)
+    with _compiled_templates_lock:
+        template = _compiled_templates.get(key)
+        if template is None or template.is_stale():
+            template = CompiledTemplate(path)
+            _compiled_templates[key] = template
+        return template
@@ -0,0 +1,88 @@
+import io
+import os
+import zipfile
+
+import pandas as pd
+from docx import Document
+
+from benchmarks.bench_pipeline import blank_png
+from docx_stream import StreamingTemplate
+from report_core import build_document, write_document
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "template.docx")
+
+
+def make_frame(rows=40):
+    # Text that needs escaping, tabs and line breaks in the answers
+    return pd.DataFrame({
+        "Kategorie": [f"Kategorie {i % 5}" for i in range(rows)],
+        "Frage": [f"Frage <{i}> & \"Anführung\"" for i in range(rows)],
+        "Antwort": [f"Antwort\tmit Tab\nund Zeile {i}" for i in range(rows)],
+        "Bewertung (1-5)": [i % 5 + 1 for i in range(rows)],
+    })
+
+
+def content(data):
+    document = Document(io.BytesIO(data))
+    paragraphs = [paragraph.text for paragraph in document.paragraphs]
+    cells = [cell.text for table in document.tables for row in table.rows for cell in row.cells]
+    headers = [paragraph.text for section in document.sections for paragraph in section.header.paragraphs]
+    return paragraphs, cells, headers, len(document.inline_shapes)
+
+
+def streamed(df, summary, company):
+    buffer = io.BytesIO()
+    write_document(buffer, blank_png(), df, summary, company, TEMPLATE)
+    return buffer.getvalue()
+
+
+def test_stream_matches_python_docx():
+    df = make_frame()
+    summary = "Erster Absatz & <Markup>\nZweite Zeile\r\nDritte Zeile"
+    expected = build_document(blank_png(), df, summary, "Firma & Co", TEMPLATE).getvalue()
+    assert content(streamed(df, summary, "Firma & Co")) == content(expected)
+
+
+def test_stream_output_is_a_valid_zip():
+    data = streamed(make_frame(), "Zusammenfassung", "Beispiel AG")
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        names = archive.namelist()
+    assert len(names) == len(set(names))
+    assert any(name.startswith("word/media/report_image") for name in names)
+
+
+def test_stream_into_zip_member():
+    # Written straight into a member of another zip, as the batch CLI does
+    outer = io.BytesIO()
+    with zipfile.ZipFile(outer, "w") as archive:
+        with archive.open("Bericht.docx", "w") as f:
+            write_document(f, blank_png(), make_frame(), "Zusammenfassung", "Beispiel AG", TEMPLATE)
+    with zipfile.ZipFile(outer) as archive:
+        assert archive.testzip() is None
+        report = archive.read("Bericht.docx")
+    with zipfile.ZipFile(io.BytesIO(report)) as archive:
+        assert archive.testzip() is None
+
+
+def test_invalid_xml_characters_are_dropped():
+    df = make_frame(3)
+    df.loc[0, "Antwort"] = "vertikaler\x0bTab"
+    paragraphs, cells, _, _ = content(streamed(df, "Zusammenfassung", "Beispiel AG"))
+    assert "vertikalerTab" in cells
+
+
+def test_unknown_placeholders_and_headers(tmp_path):
+    # Placeholders split across runs, in a header and without a value
+    document = Document()
+    document.sections[0].header.paragraphs[0].text = "Kopf {{Company_Name}}"
+    paragraph = document.add_paragraph()
+    paragraph.add_run("Vor {{Comp")
+    paragraph.add_run("any_Name}} nach").bold = True
+    document.add_paragraph("{{Unbekannt}}")
+    path = tmp_path / "template.docx"
+    document.save(path)
+
+    paragraphs, _, headers, _ = content(StreamingTemplate(str(path)).render({"Company_Name": "A&B"}))
+    assert paragraphs == ["Vor A&B nach", "{{Unbekannt}}"]
+    assert headers == ["Kopf A&B"]
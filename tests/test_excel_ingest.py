@@ -0,0 +1,71 @@
+import io
+import re
+import zipfile
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_ingest import read_survey_workbook
+from report_core import build_company_frame, list_companies
+
+
+def make_workbook(companies=5, questions=20):
+    # Layout of the survey export: companies in column F, questions from column H
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Sheet1"
+    sheet.append([f"Feld {i}" for i in range(1, 6)] + ["Firma", None]
+                 + [f"Kategorie {q % 4} - Frage {q}?" for q in range(questions)])
+    for c in range(companies):
+        answers = [None if (c + q) % 7 == 0 else f"Antwort {c}/{q}" for q in range(questions)]
+        sheet.append([c, None, None, None, None, f"Firma {c}", None] + answers)
+    if companies:
+        # A company answering twice, only its first row counts
+        sheet.append([99, None, None, None, None, "Firma 0", None] + ["später"] * questions)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def with_dimension(data, ref):
+    # Rewrite the <dimension> element that read-only openpyxl relies on
+    source = zipfile.ZipFile(io.BytesIO(data))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            content = source.read(info)
+            if info.filename == "xl/worksheets/sheet1.xml":
+                content = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="' + ref.encode() + b'"', content)
+            target.writestr(info, content)
+    return buffer.getvalue()
+
+
+def assert_matches_pandas(data):
+    df = pd.read_excel(io.BytesIO(data), sheet_name="Sheet1", header=0)
+    survey = read_survey_workbook(data)
+    assert survey.companies == list(list_companies(df))
+    for company in survey.companies:
+        pd.testing.assert_frame_equal(survey.company_frame(company), build_company_frame(df, company))
+
+
+def test_company_frames_match_read_excel():
+    assert_matches_pandas(make_workbook())
+
+
+def test_wrong_dimension_is_ignored():
+    data = with_dimension(make_workbook(), "A1:C3")
+    assert_matches_pandas(data)
+    survey = read_survey_workbook(data)
+    assert len(survey.companies) == 5
+    assert len(survey.headers) == 20
+
+
+def test_workbook_without_companies_fails_the_batch(tmp_path):
+    from batch_reports import WorkbookError, run_batch
+
+    path = tmp_path / "leer.xlsx"
+    path.write_bytes(make_workbook(companies=0))
+    assert read_survey_workbook(path.read_bytes()).empty
+    with pytest.raises(WorkbookError):
+        run_batch(str(path), str(tmp_path / "out"), log=lambda message: None)
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# JSON-lines file every finished stage is appended to
+DEFAULT_TRACE_LOG = "traces.jsonl"
+
+_log_lock = threading.Lock()
+
+
+class Stage:
+    # Measurements of one pipeline stage. API usage and retries may be
+    # recorded from several threads at once.
+
+    def __init__(self, name, **extra):
+        self.record = {
+            "stage": name,
+            "started": time.time(),
+            "seconds": 0.0,
+            "status": "ok",
+            "api_calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "retries": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+        }
+        self.record.update(extra)
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self.record["api_calls"] += 1
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        with self._lock:
+            self.record["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            self.record["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def record_retry(self, error=None):
+        with self._lock:
+            self.record["retries"] += 1
+
+    def wrap(self, client):
+        # OpenAI client whose chat completions are counted in this stage
+        return TracingClient(client, self)
+
+
+class Trace:
+    # Per-report collection of stage records, e.g. one per company
+
+    def __init__(self, name="", log_path=None):
+        self.id = uuid.uuid4().hex
+        self.name = str(name)
+        self.log_path = log_path
+        self.stages = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, cache=None, **extra):
+        # Time the block; with an LLMCache, its hits and misses during the
+        # block are attributed to the stage (other sessions sharing the
+        # cache at the same moment are counted as well)
+        stage = Stage(name, **extra)
+        before = (cache.hits, cache.misses) if cache is not None else None
+        started = time.perf_counter()
+        try:
+            yield stage
+        except BaseException as e:
+            stage.record["status"] = f"error: {e}" if isinstance(e, Exception) else "interrupted"
+            raise
+        finally:
+            stage.record["seconds"] = time.perf_counter() - started
+            if before is not None:
+                stage.record["cache_hits"] = cache.hits - before[0]
+                stage.record["cache_misses"] = cache.misses - before[1]
+            self._finish(stage)
+
+    def _finish(self, stage):
+        record = dict(stage.record, trace=self.id, name=self.name)
+        with self._lock:
+            self.stages.append(record)
+        if self.log_path:
+            line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+            with _log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def records(self):
+        with self._lock:
+            return list(self.stages)
+
+    def total(self, field):
+        return sum(record.get(field, 0) for record in self.records())
+
+
+class _TracingCompletions:
+    def __init__(self, completions, stage):
+        self._completions = completions
+        self._stage = stage
+
+    def create(self, **kwargs):
+        self._stage.record_call()
+        response = self._completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return _TracingStream(response, self._stage)
+        self._stage.record_usage(getattr(response, "usage", None))
+        return response
+
+
+class _TracingStream:
+    # Passes the chunks through and records the usage sent with the last one
+    def __init__(self, stream, stage):
+        self._stream = stream
+        self._stage = stage
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._stage.record_usage(getattr(chunk, "usage", None))
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class TracingClient:
+    def __init__(self, client, stage):
+        self.completions = _TracingCompletions(client.chat.completions, stage)
+        self.chat = self